@@ -0,0 +1,193 @@
+"""
+Shared async HTTP client for the Alpaca trading and market-data APIs.
+All accounts share one keep-alive connection pool; each account only
+differs by its key headers.
+"""
+from dotenv import load_dotenv
+from .rate_limiter import TokenBucketLimiter, PRIORITY_ORDER, PRIORITY_READ
+from .retry_policy import CircuitBreaker, RETRYABLE_STATUSES
+import httpx
+import logging
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ALPACA_TRADING_URL = os.getenv("ALPACA_TRADING_URL", "https://paper-api.alpaca.markets")
+ALPACA_DATA_URL = os.getenv("ALPACA_DATA_URL", "https://data.alpaca.markets")
+
+# Timeouts (seconds) and pool limits
+ALPACA_TIMEOUT = float(os.getenv("ALPACA_TIMEOUT", "10"))
+ALPACA_CONNECT_TIMEOUT = float(os.getenv("ALPACA_CONNECT_TIMEOUT", "5"))
+ALPACA_MAX_CONNECTIONS = int(os.getenv("ALPACA_MAX_CONNECTIONS", "100"))
+ALPACA_MAX_KEEPALIVE = int(os.getenv("ALPACA_MAX_KEEPALIVE", "20"))
+ALPACA_KEEPALIVE_EXPIRY = float(os.getenv("ALPACA_KEEPALIVE_EXPIRY", "60"))
+
+# Per-account request quota, applied separately to the trading and data APIs
+ALPACA_RATE_LIMIT_PER_MIN = float(os.getenv("ALPACA_RATE_LIMIT_PER_MIN", "200"))
+ALPACA_RATE_LIMIT_BURST = float(os.getenv("ALPACA_RATE_LIMIT_BURST", "20"))
+# Tokens that reads may not use, kept free for order submission
+ALPACA_ORDER_RESERVE = float(os.getenv("ALPACA_ORDER_RESERVE", "5"))
+ALPACA_MAX_429_RETRIES = int(os.getenv("ALPACA_MAX_429_RETRIES", "2"))
+
+# Environment variables holding the key pair of each account
+ACCOUNTS = {
+    "stock": ("ALPACA_API_KEY", "ALPACA_SECRET_KEY"),
+    "options": ("ALPACA_OPTIONS_API_KEY", "ALPACA_OPTIONS_SECRET_KEY"),
+    "short_stock": ("ALPACA_SHORT_STOCK_API_KEY", "ALPACA_SHORT_STOCK_SECRET_KEY"),
+}
+
+_http_client = None
+_clients = {}
+
+def get_http_client():
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(ALPACA_TIMEOUT, connect=ALPACA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=ALPACA_MAX_CONNECTIONS,
+                max_keepalive_connections=ALPACA_MAX_KEEPALIVE,
+                keepalive_expiry=ALPACA_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+
+class AlpacaClient:
+    def __init__(self, account: str):
+        key_env, secret_env = ACCOUNTS[account]
+        self.account = account
+        self.headers = {
+            "accept": "application/json",
+            "content-type": "application/json",
+            "APCA-API-KEY-ID": os.getenv(key_env),
+            "APCA-API-SECRET-KEY": os.getenv(secret_env),
+        }
+        self.limiters = {
+            base_url: TokenBucketLimiter(
+                ALPACA_RATE_LIMIT_PER_MIN,
+                capacity=ALPACA_RATE_LIMIT_BURST,
+                order_reserve=ALPACA_ORDER_RESERVE,
+            )
+            for base_url in (ALPACA_TRADING_URL, ALPACA_DATA_URL)
+        }
+        self.breakers = {
+            base_url: CircuitBreaker(f"{account}:{base_url}")
+            for base_url in (ALPACA_TRADING_URL, ALPACA_DATA_URL)
+        }
+
+    async def request(self, method, path, base_url=ALPACA_TRADING_URL, params=None, json=None, priority=None):
+        if priority is None:
+            # Anything that changes orders goes ahead of reads
+            priority = PRIORITY_READ if method == "GET" else PRIORITY_ORDER
+        limiter = self.limiters[base_url]
+        breaker = self.breakers[base_url]
+
+        retries = ALPACA_MAX_429_RETRIES
+        while True:
+            await limiter.acquire(priority)
+            # Checked right before the request, so a wait in the limiter
+            # cannot hold the half-open trial slot
+            breaker.before_call()
+            try:
+                response = await get_http_client().request(
+                    method,
+                    base_url + path,
+                    params=params,
+                    json=json,
+                    headers=self.headers,
+                )
+            except httpx.TransportError:
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # Cancelled or failed locally: no verdict on the broker, but free the trial
+                breaker.release_trial()
+                raise
+            if response.status_code in RETRYABLE_STATUSES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            remaining = response.headers.get("X-RateLimit-Remaining")
+            if remaining is not None and remaining.isdigit():
+                limiter.metrics["broker_remaining"] = int(remaining)
+
+            if response.status_code != 429:
+                return response
+
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else 1.0
+            logger.warning(f"Alpaca {self.account} rate limited on {path}, retrying after {delay}s")
+            limiter.pause(delay)
+            if retries <= 0:
+                return response
+            retries -= 1
+
+    def get_quota_metrics(self):
+        return {
+            "trading": {**self.limiters[ALPACA_TRADING_URL].get_metrics(), "circuit": self.breakers[ALPACA_TRADING_URL].state},
+            "data": {**self.limiters[ALPACA_DATA_URL].get_metrics(), "circuit": self.breakers[ALPACA_DATA_URL].state},
+        }
+
+    # Orders
+    async def submit_order(self, payload):
+        return await self.request("POST", "/v2/orders", json=payload)
+
+    async def get_orders(self, params=None, priority=None):
+        return await self.request("GET", "/v2/orders", params=params, priority=priority)
+
+    async def get_order(self, order_id, params=None, priority=None):
+        return await self.request("GET", f"/v2/orders/{order_id}", params=params, priority=priority)
+
+    async def get_order_by_client_order_id(self, client_order_id):
+        return await self.request("GET", "/v2/orders:by_client_order_id", params={"client_order_id": client_order_id}, priority=PRIORITY_ORDER)
+
+    async def cancel_order(self, order_id):
+        return await self.request("DELETE", f"/v2/orders/{order_id}")
+
+    async def cancel_all_orders(self):
+        return await self.request("DELETE", "/v2/orders")
+
+    # Positions and account
+    async def get_positions(self):
+        return await self.request("GET", "/v2/positions")
+
+    async def get_position(self, symbol):
+        return await self.request("GET", f"/v2/positions/{symbol}")
+
+    async def get_account(self):
+        return await self.request("GET", "/v2/account")
+
+    async def get_portfolio_history(self, params=None):
+        return await self.request("GET", "/v2/account/portfolio/history", params=params)
+
+    # Options and market data
+    async def get_option_contracts(self, params=None):
+        return await self.request("GET", "/v2/options/contracts", params=params)
+
+    async def get_option_snapshots(self, underlying, params=None):
+        return await self.request("GET", f"/v1beta1/options/snapshots/{underlying}", base_url=ALPACA_DATA_URL, params=params)
+
+    async def get_latest_option_quotes(self, symbols, params=None):
+        params = {"symbols": ",".join(symbols), "feed": "indicative", **(params or {})}
+        return await self.request("GET", "/v1beta1/options/quotes/latest", base_url=ALPACA_DATA_URL, params=params)
+
+    async def get_latest_stock_quote(self, symbol):
+        return await self.request("GET", f"/v2/stocks/{symbol}/quotes/latest", base_url=ALPACA_DATA_URL)
+
+def get_quota_metrics():
+    return {account: client.get_quota_metrics() for account, client in _clients.items()}
+
+def get_alpaca_client(account: str) -> AlpacaClient:
+    client = _clients.get(account)
+    if client is None:
+        client = AlpacaClient(account)
+        _clients[account] = client
+    return client
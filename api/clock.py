@@ -0,0 +1,87 @@
+"""
+Clock service that measures the NTP offset in the background and answers
+now() from the monotonic clock, so timestamps never wait on the network.
+"""
+from datetime import datetime
+from dotenv import load_dotenv
+from zoneinfo import ZoneInfo
+import asyncio
+import logging
+import ntplib
+import os
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NTP_SERVER = os.getenv("NTP_SERVER", "pool.ntp.org")
+CLOCK_SYNC_INTERVAL = float(os.getenv("CLOCK_SYNC_INTERVAL", "300"))
+# Retry sooner while no NTP answer has been received yet
+CLOCK_RETRY_INTERVAL = float(os.getenv("CLOCK_RETRY_INTERVAL", "30"))
+
+EASTERN = ZoneInfo("America/New_York")
+
+# Wall time and monotonic time captured at the last successful sync
+_anchor_wall = None
+_anchor_monotonic = None
+_offset = 0.0
+_sync_task = None
+
+def _measure():
+    response = ntplib.NTPClient().request(NTP_SERVER, version=3, timeout=2)
+    return response.offset
+
+async def sync_clock():
+    """
+    Query NTP once in a worker thread and re-anchor the clock.
+    Returns True on success; on failure the previous anchor is kept.
+    """
+    global _anchor_wall, _anchor_monotonic, _offset
+    try:
+        offset = await asyncio.to_thread(_measure)
+    except Exception as e:
+        logger.warning(f"Error getting NTP time: {str(e)}")
+        return False
+
+    _offset = offset
+    _anchor_monotonic = time.monotonic()
+    _anchor_wall = time.time() + offset
+    return True
+
+def timestamp():
+    # Seconds since the epoch, corrected by the last NTP offset
+    if _anchor_wall is None:
+        return time.time()
+    return _anchor_wall + (time.monotonic() - _anchor_monotonic)
+
+def now(tz=EASTERN):
+    return datetime.fromtimestamp(timestamp(), tz)
+
+def get_clock_status():
+    return {
+        "synced": _anchor_wall is not None,
+        "offset": _offset,
+        "since_sync": None if _anchor_monotonic is None else time.monotonic() - _anchor_monotonic,
+    }
+
+async def _run_clock_sync():
+    while True:
+        synced = await sync_clock()
+        await asyncio.sleep(CLOCK_SYNC_INTERVAL if synced or _anchor_wall is not None else CLOCK_RETRY_INTERVAL)
+
+def start_clock_sync():
+    global _sync_task
+    if _sync_task is None:
+        _sync_task = asyncio.create_task(_run_clock_sync())
+    return _sync_task
+
+async def stop_clock_sync():
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        try:
+            await _sync_task
+        except asyncio.CancelledError:
+            pass
+    _sync_task = None
@@ -1,74 +1,119 @@
 from fastapi import HTTPException
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 from dotenv import load_dotenv
 from .models.analyst import Analyst
+from .indexes import ensure_indexes
 
 # Load environment variables
 load_dotenv()
 
+MONGODB_DB_NAME = "tradingDB"
+
+# Pool settings for the shared client
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "20000"))
+
+_client = None
+_db = None
+_init_lock = asyncio.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        MONGODB_URL = os.getenv("MONGODB_URL")
+        _client = AsyncIOMotorClient(
+            MONGODB_URL,
+            maxPoolSize=MONGODB_MAX_POOL_SIZE,
+            minPoolSize=MONGODB_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+        )
+    return _client
+
+async def bootstrap_database(db):
+    # Get list of all databases
+    dbs = await db.client.list_database_names()
+
+    # Check if tradingDB database exists
+    if MONGODB_DB_NAME not in dbs:
+        print("Creating tradingDB database...")
+        # Create database by creating a collection
+        await db.create_collection("traders")  # Create traders collection
+        print("Created tradingDB database with collections")
+
+    # Check if collection exists
+    collections = await db.list_collection_names()
+
+    if "analyst" not in collections:
+        print("Creating analyst collection with initial data...")
+        analyst_collection = db.get_collection("analyst")
+
+        # Initial analysts data
+        initial_analysts = [{
+                "name": "John",
+                "type": "analyst1"
+            },
+            {
+                "name": "WiseGuy",
+                "type": "analyst2"
+            },
+            {
+                "name": "Tommy",
+                "type": "analyst3"
+            },
+            {
+                "name": "Johnny",
+                "type": "analyst4"
+            }]
+        await analyst_collection.insert_many(initial_analysts)
+        print("Created analyst collection with all initial data")
+
+    if "startStopSettings" not in collections:
+        print("Creating startStopSettings collection with initial data...")
+        start_stop_collection = db.get_collection("startStopSettings")
+
+        # Initial start/stop settings
+        initial_settings = {
+            "stockStart": False,
+            "optionsStart": False
+        }
+        await start_stop_collection.insert_one(initial_settings)
+        print("Created startStopSettings collection with initial data")
+
+async def connect_to_mongo():
+    """
+    Create the shared client and run the one-time bootstrap.
+    Called from the app lifespan; get_database falls back to it lazily.
+    """
+    global _db
+    if _db is not None:
+        return _db
+    async with _init_lock:
+        if _db is None:
+            db = get_client().get_database(MONGODB_DB_NAME)
+            await bootstrap_database(db)
+            await ensure_indexes(db)
+            _db = db
+    return _db
+
+async def close_mongo_connection():
+    global _client, _db
+    if _client is not None:
+        _client.close()
+    _client = None
+    _db = None
+
 async def get_database(collection_name: str):
     try:
-        MONGODB_URL = os.getenv("MONGODB_URL")
-        client = AsyncIOMotorClient(MONGODB_URL)
-        
-        # Get list of all databases
-        dbs = await client.list_database_names()
-        
-        # Check if optionsTrading database exists
-        if "tradingDB" not in dbs:
-            print("Creating tradingDB database...")
-            # Create database by inserting a document
-            db = client.get_database("tradingDB")
-            await db.create_collection("traders")  # Create traders collection
-            print("Created tradingDB database with collections")
-        
-        # Get database and collection
-        db = client.get_database("tradingDB")
-        
-        # Check if collection exists
-        collections = await db.list_collection_names()
+        db = _db if _db is not None else await connect_to_mongo()
+        return db.get_collection(collection_name)
 
-        if "analyst" not in collections:
-            print("Creating analyst collection with initial data...")
-            analyst_collection = db.get_collection("analyst")
-            
-            # Initial analysts data
-            initial_analysts = [{
-                    "name": "John",
-                    "type": "analyst1"
-                },
-                {
-                    "name": "WiseGuy",
-                    "type": "analyst2"
-                },
-                {
-                    "name": "Tommy",
-                    "type": "analyst3"
-                },
-                {
-                    "name": "Johnny",
-                    "type": "analyst4"
-                }]
-            await analyst_collection.insert_many(initial_analysts)
-            print("Created analyst collection with all initial data")
-
-        if "startStopSettings" not in collections:
-            print("Creating startStopSettings collection with initial data...")
-            start_stop_collection = db.get_collection("startStopSettings")
-            
-            # Initial start/stop settings
-            initial_settings = {
-                "stockStart": False,
-                "optionsStart": False
-            }
-            await start_stop_collection.insert_one(initial_settings)
-            print("Created startStopSettings collection with initial data")
-        
-        collection = db.get_collection(collection_name)
-        print("collection")
-        return collection
-    
     except Exception as e:
         print(f"Database connection error: {str(e)}")
         raise HTTPException(status_code=500, detail="Database connection failed")
@@ -0,0 +1,162 @@
+"""
+Scheduled sweep that closes every open option position inside the
+pre-close window of its expiry session.
+"""
+from datetime import timedelta
+from dotenv import load_dotenv
+from .alpaca_client import get_alpaca_client
+from .database import get_database
+from .fill_tracker import TERMINAL_STATUSES
+from .market_calendar import get_market_calendar
+from .retry_policy import submit_order_with_retry
+from .routes.utils import parse_option_symbol
+from . import clock
+import asyncio
+import logging
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Options are closed this long before the close of their expiry session
+EXPIRY_EXIT_LEAD = timedelta(minutes=int(os.getenv("EXPIRY_EXIT_LEAD_MINUTES", "40")))
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", "60"))
+EXPIRY_SWEEP_CONCURRENCY = int(os.getenv("EXPIRY_SWEEP_CONCURRENCY", "5"))
+# Exit orders tried per position and expiry before the sweep gives up
+EXPIRY_MAX_EXIT_ATTEMPTS = int(os.getenv("EXPIRY_MAX_EXIT_ATTEMPTS", "5"))
+
+def expiry_exit_due(expiry, now):
+    calendar = get_market_calendar()
+    session = calendar.expiry_session(expiry)
+    if session is None or not calendar.is_expiry_day(expiry, now):
+        return False
+    return now >= session[1] - EXPIRY_EXIT_LEAD
+
+def exit_order_id(symbol, expiry, attempt):
+    # Attempt 1 keeps the plain id; later attempts get a suffix
+    base = f"expiry-{symbol}-{expiry.isoformat()}"
+    return base if attempt == 1 else f"{base}-{attempt}"
+
+async def latest_exit_order(alpaca, symbol, expiry):
+    """(attempt, order) of the last exit order sent for this expiry, or (0, None)."""
+    latest = (0, None)
+    for attempt in range(1, EXPIRY_MAX_EXIT_ATTEMPTS + 1):
+        response = await alpaca.get_order_by_client_order_id(exit_order_id(symbol, expiry, attempt))
+        if response.status_code != 200:
+            break
+        latest = (attempt, response.json())
+    return latest
+
+async def close_expiring_position(alpaca, position, expiry, semaphore):
+    symbol = position["symbol"]
+    qty = float(position["qty"])
+    side = "buy" if qty < 0 else "sell"
+    result = {"symbol": symbol, "qty": abs(qty), "side": side, "status": "failed", "order_id": "", "error": None}
+
+    async with semaphore:
+        try:
+            # One client order id per attempt keeps repeated sweeps from doubling a live exit
+            attempt, existing = await latest_exit_order(alpaca, symbol, expiry)
+            if existing is not None and existing["status"] not in TERMINAL_STATUSES:
+                result["status"] = "already_submitted"
+                result["order_id"] = existing["id"]
+                return result
+            if existing is not None and existing["status"] == "filled":
+                # The position list can lag behind a fill that just landed
+                result["status"] = "filled"
+                result["order_id"] = existing["id"]
+                return result
+            if attempt >= EXPIRY_MAX_EXIT_ATTEMPTS:
+                result["error"] = f"Gave up after {attempt} exit attempts (last {existing['status']})"
+                return result
+
+            # Rejected, cancelled, expired or partly filled: send what the position still holds
+            payload = {
+                "type": "market",
+                "time_in_force": "day",
+                "symbol": symbol,
+                "qty": abs(qty),
+                "side": side,
+                "client_order_id": exit_order_id(symbol, expiry, attempt + 1),
+            }
+            response = await submit_order_with_retry(alpaca, payload)
+            if response.status_code == 200:
+                result["status"] = "submitted"
+                result["order_id"] = response.json()["id"]
+            else:
+                result["error"] = response.text
+        except Exception as e:
+            result["error"] = str(e)
+    return result
+
+def _leg_closed(side, symbol_field):
+    return {"$or": [
+        {symbol_field: ""},
+        {f"{side}ExitTradingId": {"$nin": [None, ""]}},
+        {f"{side}ExitPrice": {"$ne": None}},
+    ]}
+
+async def mark_swept_spreads(results):
+    """
+    Record the sweep's exit orders on the open spreads in optionsDatabase,
+    so a later CLOSE signal does not trade legs that are already flat.
+    """
+    exits = {result["symbol"]: result["order_id"] for result in results if result["order_id"]}
+    if not exits:
+        return
+    options_collection = await get_database("optionsDatabase")
+    for symbol, order_id in exits.items():
+        await options_collection.update_many(
+            {"status": "open", "sell_symbol": symbol}, {"$set": {"sellExitTradingId": order_id}}
+        )
+        await options_collection.update_many(
+            {"status": "open", "buy_symbol": symbol}, {"$set": {"buyExitTradingId": order_id}}
+        )
+    await options_collection.update_many(
+        {"status": "open", "$and": [_leg_closed("sell", "sell_symbol"), _leg_closed("buy", "buy_symbol")]},
+        {"$set": {"status": "closed", "exitTimeStamp": clock.now().strftime("%Y-%m-%d %H:%M:%S %Z"), "exitReason": "expiry_sweep"}},
+    )
+
+async def sweep_expiring_options(now=None, force=False):
+    """
+    Load all option positions once, parse their expiries with the cached
+    OCC parser and close those due for their pre-close exit. Returns
+    per-symbol results.
+    """
+    now = now or clock.now()
+    calendar = get_market_calendar()
+
+    # Any due position expires in today's session, so skip the broker call
+    # outside the last EXPIRY_EXIT_LEAD of a session
+    if not force:
+        try:
+            time_left = calendar.time_to_close(now)
+        except ValueError:
+            time_left = None
+        if time_left is None or time_left > EXPIRY_EXIT_LEAD:
+            return {"checked": 0, "results": []}
+
+    alpaca = get_alpaca_client("options")
+    response = await alpaca.get_positions()
+    positions = [position for position in response.json() if position.get("asset_class") == "us_option"]
+
+    semaphore = asyncio.Semaphore(EXPIRY_SWEEP_CONCURRENCY)
+    tasks = []
+    for position in positions:
+        try:
+            expiry = parse_option_symbol(position["symbol"]).expiry
+        except ValueError:
+            logger.warning(f"Skipping position with unparseable symbol {position['symbol']}")
+            continue
+        if expiry_exit_due(expiry, now):
+            tasks.append(close_expiring_position(alpaca, position, expiry, semaphore))
+    results = list(await asyncio.gather(*tasks))
+    try:
+        await mark_swept_spreads(results)
+    except Exception as e:
+        logger.error(f"Error marking swept spreads closed: {str(e)}")
+
+    for result in results:
+        logger.info(f"Expiry sweep {result['symbol']}: {result['status']} {result['error'] or ''}")
+    return {"checked": len(positions), "results": results}
@@ -0,0 +1,59 @@
+"""
+Fill tracker used when the trade_updates stream is unavailable.
+Polls the single order with exponential backoff until it reaches a
+terminal status, instead of listing every order of the symbol.
+"""
+from dotenv import load_dotenv
+import asyncio
+import logging
+import os
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FILL_POLL_INITIAL_DELAY = float(os.getenv("FILL_POLL_INITIAL_DELAY", "0.05"))
+FILL_POLL_MAX_DELAY = float(os.getenv("FILL_POLL_MAX_DELAY", "2"))
+FILL_POLL_TIMEOUT = float(os.getenv("FILL_POLL_TIMEOUT", "10"))
+
+# Order statuses after which polling stops
+TERMINAL_STATUSES = {"filled", "canceled", "expired", "rejected", "done_for_day", "replaced"}
+
+async def track_fill(alpaca, order_id, params=None, timeout=FILL_POLL_TIMEOUT,
+                     initial_delay=FILL_POLL_INITIAL_DELAY, max_delay=FILL_POLL_MAX_DELAY):
+    """
+    Poll GET /v2/orders/{order_id} until the order is terminal or `timeout`
+    seconds pass. Returns the fill price, quantity and timestamp along with
+    the last order seen, the number of polls and the elapsed time.
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    polls = 0
+    order = None
+    while True:
+        polls += 1
+        response = await alpaca.get_order(order_id, params)
+        if response.status_code == 200:
+            order = response.json()
+            if order.get("status") in TERMINAL_STATUSES:
+                break
+        else:
+            logger.warning(f"Order {order_id} lookup returned {response.status_code}")
+
+        if time.monotonic() - start + delay > timeout:
+            logger.warning(f"Order {order_id} not terminal after {timeout}s")
+            break
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+    return {
+        "order_id": order_id,
+        "status": order.get("status") if order else None,
+        "filled_avg_price": order.get("filled_avg_price") if order else None,
+        "filled_qty": order.get("filled_qty") if order else None,
+        "filled_at": order.get("filled_at") if order else None,
+        "order": order,
+        "polls": polls,
+        "elapsed": time.monotonic() - start,
+    }
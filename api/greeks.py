@@ -0,0 +1,138 @@
+"""
+Vectorized Black-Scholes engine for whole option chains.
+Implied volatility is solved from the bid/ask mid for every contract at
+once with a bracketed Newton iteration, then delta, gamma, theta and vega
+are computed from it in the same array pass.
+"""
+from dotenv import load_dotenv
+import numpy as np
+import os
+
+load_dotenv()
+
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.045"))
+DIVIDEND_YIELD = float(os.getenv("DIVIDEND_YIELD", "0"))
+
+IV_MIN = 1e-4
+IV_MAX = 5.0
+IV_TOLERANCE = 1e-6
+IV_MAX_ITERATIONS = 60
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+def _erf(x):
+    # Abramowitz & Stegun 7.1.26 rational approximation, absolute error < 1.5e-7
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-x * x))
+
+def norm_cdf(x):
+    return 0.5 * (1.0 + _erf(x / np.sqrt(2.0)))
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2.0 * np.pi)
+
+def _d1_d2(spot, strike, years, rate, dividend, sigma):
+    sqrt_t = np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate - dividend + 0.5 * sigma * sigma) * years) / (sigma * sqrt_t)
+    return d1, d1 - sigma * sqrt_t
+
+def bs_price(spot, strike, years, sigma, is_call, rate=RISK_FREE_RATE, dividend=DIVIDEND_YIELD):
+    d1, d2 = _d1_d2(spot, strike, years, rate, dividend, sigma)
+    spot_disc = spot * np.exp(-dividend * years)
+    strike_disc = strike * np.exp(-rate * years)
+    call = spot_disc * norm_cdf(d1) - strike_disc * norm_cdf(d2)
+    put = strike_disc * norm_cdf(-d2) - spot_disc * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+def bs_vega(spot, strike, years, sigma, rate=RISK_FREE_RATE, dividend=DIVIDEND_YIELD):
+    # Per unit of volatility (1.00 = 100 vol points)
+    d1, _ = _d1_d2(spot, strike, years, rate, dividend, sigma)
+    return spot * np.exp(-dividend * years) * norm_pdf(d1) * np.sqrt(years)
+
+def implied_volatility(price, spot, strike, years, is_call, rate=RISK_FREE_RATE, dividend=DIVIDEND_YIELD):
+    """
+    Solve sigma for every contract at once. Each contract keeps a
+    [low, high] bracket; Newton steps that leave it fall back to bisection.
+    Prices outside the no-arbitrage bounds give NaN.
+    """
+    price, spot, strike, years = np.broadcast_arrays(
+        np.asarray(price, dtype=float), np.asarray(spot, dtype=float),
+        np.asarray(strike, dtype=float), np.asarray(years, dtype=float),
+    )
+    is_call = np.broadcast_to(np.asarray(is_call, dtype=bool), price.shape)
+
+    spot_disc = spot * np.exp(-dividend * years)
+    strike_disc = strike * np.exp(-rate * years)
+    lower = np.where(is_call, np.maximum(spot_disc - strike_disc, 0.0), np.maximum(strike_disc - spot_disc, 0.0))
+    upper = np.where(is_call, spot_disc, strike_disc)
+    valid = np.isfinite(price) & (years > 0) & (spot > 0) & (strike > 0) & (price > lower) & (price < upper)
+
+    low = np.full(price.shape, IV_MIN)
+    high = np.full(price.shape, IV_MAX)
+    sigma = np.full(price.shape, 0.3)
+    active = valid.copy()
+
+    for _ in range(IV_MAX_ITERATIONS):
+        if not active.any():
+            break
+        s, k, t, c, target = spot[active], strike[active], years[active], is_call[active], price[active]
+        sig = sigma[active]
+        diff = bs_price(s, k, t, sig, c, rate, dividend) - target
+        vega = bs_vega(s, k, t, sig, rate, dividend)
+
+        lo = np.where(diff < 0, sig, low[active])
+        hi = np.where(diff > 0, sig, high[active])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = sig - diff / vega
+        step = np.where((vega > 1e-12) & (step > lo) & (step < hi), step, 0.5 * (lo + hi))
+
+        low[active], high[active], sigma[active] = lo, hi, step
+        done = (np.abs(diff) < IV_TOLERANCE) | (hi - lo < IV_TOLERANCE)
+        # Converged contracts keep the sigma that met the tolerance
+        sigma[np.flatnonzero(active)[done]] = sig[done]
+        active[np.flatnonzero(active)[done]] = False
+
+    return np.where(valid, sigma, np.nan)
+
+def chain_greeks(spot, strike, years, is_call, bid, ask, rate=RISK_FREE_RATE, dividend=DIVIDEND_YIELD):
+    """
+    IV from the bid/ask mid, then greeks in Alpaca's units: theta per
+    calendar day and vega per volatility point. Rows without a usable
+    quote or IV come back as NaN.
+    """
+    strike = np.asarray(strike, dtype=float)
+    years = np.asarray(years, dtype=float)
+    is_call = np.asarray(is_call, dtype=bool)
+    bid = np.asarray(bid, dtype=float)
+    ask = np.asarray(ask, dtype=float)
+
+    mid = np.where((bid > 0) & (ask >= bid), 0.5 * (bid + ask), np.nan)
+    iv = implied_volatility(mid, spot, strike, years, is_call, rate, dividend)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.where(np.isnan(iv), 1.0, iv)
+        t = np.where(years > 0, years, 1.0)
+        sqrt_t = np.sqrt(t)
+        d1, d2 = _d1_d2(spot, strike, t, rate, dividend, sigma)
+        div_disc = np.exp(-dividend * t)
+        rate_disc = np.exp(-rate * t)
+        pdf = norm_pdf(d1)
+
+        delta = np.where(is_call, div_disc * norm_cdf(d1), -div_disc * norm_cdf(-d1))
+        gamma = div_disc * pdf / (spot * sigma * sqrt_t)
+        vega = spot * div_disc * pdf * sqrt_t / 100
+        decay = -spot * div_disc * pdf * sigma / (2 * sqrt_t)
+        call_theta = decay - rate * strike * rate_disc * norm_cdf(d2) + dividend * spot * div_disc * norm_cdf(d1)
+        put_theta = decay + rate * strike * rate_disc * norm_cdf(-d2) - dividend * spot * div_disc * norm_cdf(-d1)
+        theta = np.where(is_call, call_theta, put_theta) / 365
+
+    missing = np.isnan(iv)
+    return {
+        "iv": iv,
+        "delta": np.where(missing, np.nan, delta),
+        "gamma": np.where(missing, np.nan, gamma),
+        "theta": np.where(missing, np.nan, theta),
+        "vega": np.where(missing, np.nan, vega),
+    }
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException , WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException , WebSocket, WebSocketDisconnect, Request, Response
 from motor.motor_asyncio import AsyncIOMotorClient
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -9,23 +9,69 @@ from .globals import Profit, Loss
 import os
 import re
 import asyncio
-from .database import get_database
+import time
+import websockets
+from .database import get_database, connect_to_mongo, close_mongo_connection
+from .settings_cache import get_cached_settings, get_cached_start_stop_settings, refresh_settings, start_settings_watcher, stop_settings_watcher
 from pydantic import BaseModel
-import requests
-import ntplib
+from .alpaca_client import get_alpaca_client, close_http_client, get_quota_metrics
+from .trade_updates import ORDER_FILL_TIMEOUT, get_trade_updates_stream, start_trade_updates, stop_trade_updates
+from .fill_tracker import track_fill
+from .ttl_cache import TTLCache
+from .retry_policy import submit_order_with_retry
+from . import clock
+from .market_calendar import get_market_calendar
+from .expiry_sweeper import sweep_expiring_options, expiry_exit_due, EXPIRY_EXIT_LEAD, EXPIRY_SWEEP_INTERVAL
+from .order_sync import get_closed_orders
+from .wire_format import Layout, render, shape_rows
+from .quote_hub import QuoteSubscriber, get_quote_hub
+from .signal_queue import enqueue_signal, get_queue_metrics, get_signal, register_handler, signal_order_id, start_signal_queue, stop_signal_queue
+from bson import ObjectId
 from datetime import datetime
-from zoneinfo import ZoneInfo
-from .routes.utils import parse_option_date
+from .routes.utils import parse_option_symbol
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import logging
 
 from typing import Dict, Set, List, Optional
+from contextlib import asynccontextmanager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-app = FastAPI()
+scheduler = AsyncIOScheduler()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared Mongo pool and run the one-time bootstrap
+    await connect_to_mongo()
+    get_market_calendar()
+    await refresh_settings()
+    start_settings_watcher()
+    await start_signal_queue()
+    start_trade_updates(["stock", "options"])
+    clock.start_clock_sync()
+    scheduler.add_job(
+        sweep_expiring_options,
+        trigger='interval',
+        seconds=EXPIRY_SWEEP_INTERVAL,
+        id="expiry_sweep",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.start()
+    yield
+    scheduler.shutdown(wait=False)
+    await clock.stop_clock_sync()
+    await stop_trade_updates()
+    await get_quote_hub().stop()
+    await stop_signal_queue()
+    await stop_settings_watcher()
+    await close_http_client()
+    await close_mongo_connection()
+
+app = FastAPI(lifespan=lifespan)
 
 entry_price = 0
 updated_entry_price = 0
@@ -38,6 +84,15 @@ order_id = ""
 check_in_order_status = False
 all_sell_stop = False
 
+# Seconds the combined /account dashboard payload is served from cache
+ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "5"))
+account_cache = TTLCache(ACCOUNT_CACHE_TTL)
+
+# "mleg" sends a spread as one multi-leg limit order, "legs" as two market orders
+OPTIONS_EXECUTION_MODE = os.getenv("OPTIONS_EXECUTION_MODE", "mleg")
+# Added to the net mid price of a multi-leg order (positive pays up on a debit)
+OPTIONS_MLEG_LIMIT_OFFSET = float(os.getenv("OPTIONS_MLEG_LIMIT_OFFSET", "0"))
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -49,8 +104,7 @@ app.add_middleware(
 
 async def update_profit_loss_from_db():
     try:
-        settings_collection = await get_database("settings")
-        settings = await settings_collection.find_one({})
+        settings = await get_cached_settings()
         global Profit, Loss
         Profit = settings["profitPercent"]
         Loss = settings["lossPercent"]
@@ -59,6 +113,8 @@ async def update_profit_loss_from_db():
 
 class SignalRequest(BaseModel):
     message: str
+    # Optional sender-side id; without it the parsed signal is fingerprinted
+    signalId: Optional[str] = None
 
     def parse_signal(self):
         # Parse the message like "buySignal\nsymbol : CRYPTO10\nprice : 17697.7"
@@ -83,35 +139,40 @@ class SignalRequest(BaseModel):
         }
 
 
-@app.post("/shortStockSignal")
-async def short_stock_signal(signal_request: SignalRequest):
+@app.post("/shortStockSignal", status_code=202)
+async def short_stock_signal(signal_request: SignalRequest, response: Response):
     try:
         parsed_data = signal_request.parse_signal()
         logger.info(f"[{datetime.now()}] Received signal endpoint called with data: {parsed_data}")
-        
-        # Handle buy signals
-        if parsed_data["signal_type"] == "buy":
-            symbol = parsed_data["symbol"]
-            quantity = parsed_data["quantity"]
-            price = parsed_data["price"]
-            # Your buy order logic here
-            result = await create_short_stock_order(symbol,quantity,price)
-            return {"message": "Buy order processed", "buy_result->": result}
-        
-        # Handle sell signals
-        elif parsed_data["signal_type"] == "sell":
-            # Your sell order logic here
-            print("sellOrder--------->occured")
-            symbol = parsed_data["symbol"]
-            quantity = parsed_data["quantity"]
-            price = parsed_data["price"]
-            result = await create_short_stock_sell_order(symbol, quantity, price)
-            return {"message": "Sell order processed", "sell_result->": result}
-            
-        return {"message": "Signal received", "data": parsed_data}
+
+        if parsed_data["signal_type"] not in ("buy", "sell"):
+            return {"message": "Signal received", "data": parsed_data}
+        if not parsed_data["symbol"] or parsed_data["quantity"] is None:
+            raise ValueError("Signal needs a symbol and a quantity")
+
+        # Short positions are independent per symbol, so each symbol gets its own lane
+        signal_id, state = await enqueue_signal(
+            "shortStock", f"shortStock:{parsed_data['symbol']}", parsed_data, signal_request.signalId
+        )
+        return await queued_signal_response(response, signal_id, state)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+async def process_short_stock_signal(parsed_data):
+    symbol = parsed_data["symbol"]
+    quantity = parsed_data["quantity"]
+    price = parsed_data["price"]
+
+    # Handle buy signals
+    if parsed_data["signal_type"] == "buy":
+        result = await create_short_stock_order(symbol,quantity,price)
+        return {"message": "Buy order processed", "buy_result->": result}
+
+    # Handle sell signals
+    print("sellOrder--------->occured")
+    result = await create_short_stock_sell_order(symbol, quantity, price)
+    return {"message": "Sell order processed", "sell_result->": result}
+
 class OptionsData(BaseModel):
     sell_close: str
     buy_close: str
@@ -122,66 +183,216 @@ class OptionsSignal(BaseModel):
     quantity: int
     options: OptionsData
     reason: str
+    signalId: Optional[str] = None
 
 async def get_settings():
     try:
-        settings_collection = await get_database("settings")
-        settings = await settings_collection.find_one({})
+        settings = await get_cached_settings()
         return settings
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/optionsTrading")
-async def options_trading(signal_request: OptionsSignal):
+@app.post("/optionsTrading", status_code=202)
+async def options_trading(signal_request: OptionsSignal, response: Response):
     try:
-        startStopSettingsCollection = await get_database("startStopSettings")
-        startStopSettings = await startStopSettingsCollection.find_one({})
+        startStopSettings = await get_cached_start_stop_settings()
         options_start = startStopSettings["optionsStart"]
         if options_start == False:
             return {"message": "Stock trading is not started"}
-        
-        sell_symbol = signal_request.options.sell_close
-        buy_symbol = signal_request.options.buy_close
 
-        settings = await get_settings()
-        stock_amount = settings["stockAmount"]
-        options_amount = settings["optionsAmount"]
+        if signal_request.action not in ("OPEN", "CLOSE"):
+            raise ValueError(f"Unknown options action: {signal_request.action}")
 
-        # return {"stock_amount": stock_amount, "options_amount": options_amount}
-        # quantity = signal_request.quantity
-        
-        if signal_request.action == "OPEN":
-            print("open signal")
-            result = await create_options_buy_order(sell_symbol,buy_symbol,options_amount , signal_request.strategy , signal_request.reason)
-            return {"message": "Buy order processed", "buy_result->": result}
+        # CLOSE closes every open spread, so all options signals share one lane
+        signal_id, state = await enqueue_signal(
+            "options", "options", signal_request.model_dump(exclude={"signalId"}), signal_request.signalId
+        )
+        return await queued_signal_response(response, signal_id, state)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Handle sell signals
-        elif signal_request.action == "CLOSE":
-            # Your sell order logic here
-            
-            result = await create_options_sell_order()
+async def process_options_signal(payload):
+    # Trading may have been stopped while the signal waited in the queue
+    startStopSettings = await get_cached_start_stop_settings()
+    if startStopSettings["optionsStart"] == False:
+        return {"message": "Options trading is not started"}
+
+    signal_request = OptionsSignal(**payload)
+    sell_symbol = signal_request.options.sell_close
+    buy_symbol = signal_request.options.buy_close
+
+    settings = await get_settings()
+    options_amount = settings["optionsAmount"]
+
+    if signal_request.action == "OPEN":
+        print("open signal")
+        result = await create_options_buy_order(sell_symbol,buy_symbol,options_amount , signal_request.strategy , signal_request.reason)
+        return {"message": "Buy order processed", "buy_result->": result}
+
+    # Handle sell signals
+    result = await create_options_sell_order()
+    return {"message": "Sell order processed", "sell_result->": result}
+
+async def submit_option_leg(alpaca, payload):
+    """
+    Submit one leg of a spread with the order retry policy.
+    Returns a per-leg result instead of raising.
+    """
+    leg = {
+        "symbol": payload["symbol"],
+        "side": payload["side"],
+        "status": "failed",
+        "order_id": "",
+        "filled_qty": None,
+        "filled_avg_price": None,
+        "error": None,
+    }
+    try:
+        response = await submit_order_with_retry(alpaca, payload)
+        if response.status_code != 200:
+            leg["error"] = response.text
+            return leg
 
-            return {"message": "Sell order processed", "sell_result->": result}
-            
-        return {"message": "Signal received", "data": result}
+        leg["status"] = "submitted"
+        leg["order_id"] = response.json()["id"]
+        return leg
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        leg["error"] = str(e)
+        return leg
+
+async def confirm_option_leg_fill(alpaca, leg):
+    if leg["status"] != "submitted":
+        return leg
+    try:
+        order = await await_order_fill(alpaca.account, leg["order_id"])
+        if order is not None:
+            leg["filled_qty"] = order["filled_qty"]
+            leg["filled_avg_price"] = order["filled_avg_price"]
+    except Exception as e:
+        leg["error"] = str(e)
+    return leg
+
+async def execute_option_legs(alpaca, payloads):
+    # Submit every leg at once, then confirm every fill at once
+    legs = await asyncio.gather(*[submit_option_leg(alpaca, payload) for payload in payloads])
+    legs = await asyncio.gather(*[confirm_option_leg_fill(alpaca, leg) for leg in legs])
+    return list(legs)
+
+async def mleg_net_limit_price(alpaca, payloads):
+    """
+    Net mid of the spread: positive is a debit, negative a credit.
+    Returns None when a leg has no two-sided quote to price it from.
+    """
+    response = await alpaca.get_latest_option_quotes([payload["symbol"] for payload in payloads])
+    if response.status_code != 200:
+        logger.warning(f"Option quotes request failed ({response.status_code}): {response.text}")
+        return None
+    quotes = response.json().get("quotes") or {}
+    net_price = 0
+    for payload in payloads:
+        quote = quotes.get(payload["symbol"]) or {}
+        if not quote.get("ap") or not quote.get("bp"):
+            logger.warning(f"No two-sided quote for {payload['symbol']}: {quote}")
+            return None
+        mid = (quote["ap"] + quote["bp"]) / 2
+        net_price += mid if payload["side"] == "buy" else -mid
+    return round(net_price + OPTIONS_MLEG_LIMIT_OFFSET, 2)
+
+async def execute_mleg_order(alpaca, payloads, intents, client_order_id=None):
+    """
+    Submit the legs as one multi-leg order and confirm its fill.
+    Returns one result per leg, in the same shape as execute_option_legs,
+    all carrying the combined order id. Without quotes to set the net
+    limit price the legs are sent as separate market orders instead.
+    """
+    legs = [{
+        "symbol": payload["symbol"],
+        "side": payload["side"],
+        "status": "failed",
+        "order_id": "",
+        "filled_qty": None,
+        "filled_avg_price": None,
+        "error": None,
+    } for payload in payloads]
+    try:
+        limit_price = await mleg_net_limit_price(alpaca, payloads)
+        if limit_price is None:
+            logger.warning("Cannot price the multi-leg order, sending the legs separately")
+            return await execute_option_legs(alpaca, payloads)
+        mleg_payload = {
+            "order_class": "mleg",
+            "type": "limit",
+            "time_in_force": "day",
+            "qty": str(payloads[0]["qty"]),
+            "limit_price": str(limit_price),
+            "client_order_id": client_order_id,
+            "legs": [{
+                "symbol": payload["symbol"],
+                "ratio_qty": "1",
+                "side": payload["side"],
+                "position_intent": intent,
+            } for payload, intent in zip(payloads, intents)]
+        }
+        logger.debug(f"mleg_payload {mleg_payload}")
+
+        response = await submit_order_with_retry(alpaca, mleg_payload)
+        if response.status_code != 200:
+            for leg in legs:
+                leg["error"] = response.text
+            return legs
+
+        order_id = response.json()["id"]
+        for leg in legs:
+            leg["status"] = "submitted"
+            leg["order_id"] = order_id
+
+        order = await await_order_fill(alpaca.account, order_id, {"nested": "true"})
+        if (order or {}).get("status") != "filled":
+            # The net-mid limit did not fill in time; pull it so nothing is left working
+            order = await cancel_unfilled_order(alpaca, order_id, {"nested": "true"})
+        fills = {fill["symbol"]: fill for fill in (order or {}).get("legs") or []}
+        for leg in legs:
+            fill = fills.get(leg["symbol"])
+            if fill:
+                leg["filled_qty"] = fill["filled_qty"]
+                leg["filled_avg_price"] = fill["filled_avg_price"]
+            if not float(leg["filled_qty"] or 0):
+                leg["status"] = "failed"
+                leg["error"] = f"Order {order_id} did not fill in time and was cancelled"
+    except Exception as e:
+        for leg in legs:
+            leg["error"] = str(e)
+    return legs
+
+async def cancel_unfilled_order(alpaca, order_id, params=None):
+    """Cancel a working order and return its final state, including any partial fill."""
+    response = await alpaca.cancel_order(order_id)
+    if response.status_code not in (200, 204):
+        # 422 means it is no longer cancelable, e.g. it filled meanwhile
+        logger.warning(f"Cancel of order {order_id} returned {response.status_code}: {response.text}")
+    fill = await track_fill(alpaca, order_id, params)
+    return fill["order"]
+
+def legs_result(legs):
+    submitted = [leg for leg in legs if leg["status"] == "submitted"]
+    if len(submitted) == len(legs):
+        return "success"
+    elif submitted:
+        return "partial"
+    return "failed"
 
 async def create_options_buy_order(sell_symbol, buy_symbol, quantity , strategy , reason):
     try :
-        # Configure Alpaca credentials
-        alpaca_api = os.getenv("ALPACA_OPTIONS_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
+        alpaca = get_alpaca_client("options")
         formatted_time = await current_time()
 
-        url = "https://paper-api.alpaca.markets/v2/orders"
-
         sell_payload = {
             "type": "market",
             "time_in_force": "day",
             "symbol": sell_symbol,
             "qty": quantity,
-            "side": "sell"
+            "side": "sell",
+            "client_order_id": signal_order_id("open-sell"),
         }   
 
         buy_payload = {
@@ -189,88 +400,45 @@ async def create_options_buy_order(sell_symbol, buy_symbol, quantity , strategy
             "time_in_force": "day",
             "symbol": buy_symbol,
             "qty": quantity,
-            "side": "buy"
-        }
-
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
+            "side": "buy",
+            "client_order_id": signal_order_id("open-buy"),
         }
 
         print("sell_payload", sell_payload)
         print("buy_payload", buy_payload)
 
+        use_mleg = OPTIONS_EXECUTION_MODE == "mleg"
+        if use_mleg:
+            sell_leg, buy_leg = await execute_mleg_order(
+                alpaca, [sell_payload, buy_payload], ["sell_to_open", "buy_to_open"], signal_order_id("open")
+            )
+        else:
+            sell_leg, buy_leg = await execute_option_legs(alpaca, [sell_payload, buy_payload])
+        result = legs_result([sell_leg, buy_leg])
 
-        response = requests.post(url, json=buy_payload, headers=headers)
-        second_result_status = response.status_code
-        second_trading_id = response.json()["id"]
-        times = 10;
-        while second_result_status != 200 and times > 0:
-            response = requests.post(url, json=buy_payload, headers=headers)
-            second_result_status = response.status_code
-            times -= 1
-
-        # print(response.status_code)
-        # print("second time" , times)
-
-        response = requests.post(url, json=sell_payload, headers=headers)
-        first_result_status = response.status_code
-        first_trading_id = response.json()["id"]
-        times = 10;
-        while first_result_status != 200 and times > 0:
-            response = requests.post(url, json=sell_payload, headers=headers)
-            first_result_status = response.status_code
-            times -= 1
-        
-        # print(response.status_code)
-        # print("first time" , times)
-
-        if first_result_status != 200:
-            sell_symbol = ""
-        if second_result_status !=200:
-            buy_symbol = ""
-
-        if(sell_symbol != "" ):
-            url = "https://paper-api.alpaca.markets/v2/orders?status=all&symbols=" + sell_symbol
-            response = requests.get(url, headers=headers)
-            for order in response.json():
-                if order["id"] == first_trading_id:
-                    print("***********sell_symbol", sell_symbol)
-                    price = order["filled_avg_price"]
-                    quantity = order["filled_qty"]
-                    sell_quantity = quantity
-                    sell_price = price
-                    break;
-
-        if(buy_symbol != ""):
-            url = "https://paper-api.alpaca.markets/v2/orders?status=all&symbols=" + buy_symbol
-            response = requests.get(url, headers=headers)
-            for order in response.json():
-                if order["id"] == second_trading_id:
-                    print("***********buy_symbol", buy_symbol)
-                    price = order["filled_avg_price"]
-                    quantity = order["filled_qty"]
-                    buy_quantity = quantity
-                    buy_price = price
-                    break;
-                    
+        if result == "failed":
+            return {"message": "Buy order failed", "buy_result->": result, "legs": [sell_leg, buy_leg]}
 
+        # A failed leg is stored with an empty symbol so the close path skips it
         options_collection = await get_database("optionsDatabase")
         options_data = {
-            "sell_symbol": sell_symbol,
-            "sellTradingId": first_trading_id,
-            "sellQuantity": sell_quantity,
+            "sell_symbol": sell_symbol if sell_leg["status"] == "submitted" else "",
+            "sellTradingId": sell_leg["order_id"],
+            "sellQuantity": sell_leg["filled_qty"],
+            # Kept apart from the filled qty, which is unknown if a fill is not confirmed in time
+            "sellRequestedQuantity": quantity,
             "sellSoldQuantity": 0,
-            "sellEntryPrice": sell_price,
+            "sellEntryPrice": sell_leg["filled_avg_price"],
             "sellExitPrice": None,
-            "buy_symbol": buy_symbol,
-            "buyTradingId": second_trading_id,
-            "buyEntryPrice": buy_price,
+            "buy_symbol": buy_symbol if buy_leg["status"] == "submitted" else "",
+            "buyTradingId": buy_leg["order_id"],
+            "buyEntryPrice": buy_leg["filled_avg_price"],
             "buyExitPrice": None,
-            "buyQuantity": buy_quantity,
+            "buyQuantity": buy_leg["filled_qty"],
+            "buyRequestedQuantity": quantity,
             "buySoldQuantity": 0,
+            "orderClass": "mleg" if use_mleg else "simple",
+            "orderId": sell_leg["order_id"] if use_mleg else None,
             "action": "OPEN",
             "strategy": strategy,
             "reason": reason,
@@ -282,7 +450,7 @@ async def create_options_buy_order(sell_symbol, buy_symbol, quantity , strategy
 
         await options_collection.insert_one(options_data)
 
-        return {"message": "Buy order processed", "buy_result->": "success"}
+        return {"message": "Buy order processed", "buy_result->": result, "legs": [sell_leg, buy_leg]}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -291,23 +459,25 @@ async def create_options_sell_order():
         
         options_collection = await get_database("optionsDatabase")
         options_data = await options_collection.find_one({"status": "open"})
+        if not options_data:
+            return {"message": "No open options position found", "sell_result->": "not_found"}
+
         sell_symbol = options_data["sell_symbol"]
         buy_symbol = options_data["buy_symbol"]
-        sell_quantity = options_data["sellQuantity"]
-        buy_quantity = options_data["buyQuantity"]
+        # Fall back to the requested qty when the opening fill was never confirmed
+        sell_quantity = options_data["sellQuantity"] or options_data.get("sellRequestedQuantity")
+        buy_quantity = options_data["buyQuantity"] or options_data.get("buyRequestedQuantity")
         
-        alpaca_api = os.getenv("ALPACA_OPTIONS_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
+        alpaca = get_alpaca_client("options")
         formatted_time = await current_time()
         
-        url = "https://paper-api.alpaca.markets/v2/orders"
-        
         sell_payload = { 
             "type": "market",
             "time_in_force": "day",
             "symbol": sell_symbol,
             "qty": sell_quantity,
-            "side": "buy"
+            "side": "buy",
+            "client_order_id": signal_order_id("close-sell"),
         }
 
         buy_payload = {
@@ -315,99 +485,65 @@ async def create_options_sell_order():
             "time_in_force": "day",
             "symbol": buy_symbol,
             "qty": buy_quantity,
-            "side": "sell"
-        }
-
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
+            "side": "sell",
+            "client_order_id": signal_order_id("close-buy"),
         }
 
-        first_result_status = 0
-        first_trading_id = ""
-        second_result_status = 0
-        second_trading_id = ""
-        
-        if sell_symbol != "":
-            response = requests.post(url, json=sell_payload, headers=headers)
-            second_result_status = response.status_code
-            times = 10;
-            while second_result_status != 200 and times > 0:
-                response = requests.post(url, json=sell_payload, headers=headers)
-                second_result_status = response.status_code
-                if(second_result_status != 200):
-                    second_trading_id = response.json()["id"]
-                    break;
-                times -= 1
-            # print("response1", response.status_code)
-            print("first time" , times)
-        else:
-            first_result_status = 200
-
-        if buy_symbol != "":
-            response = requests.post(url, json=buy_payload, headers=headers)
-            first_result_status = response.status_code
-            times = 10;
-            while first_result_status != 200 and times > 0:
-                response = requests.post(url, json=buy_payload, headers=headers)
-                first_result_status = response.status_code
-                if(first_result_status != 200):
-                    second_trading_id = response.json()["id"]
-                    break;
-                times -= 1
-            # print("response2", first_result_status)
-            print("second time" , times)
+        # Close only the legs that were opened and have no exit order yet. An exit
+        # order whose fill was not confirmed still counts; sending it again
+        # would open the opposite position.
+        def exit_submitted(side):
+            # Records from before exit ids were stored only carry the exit price
+            return bool(options_data.get(f"{side}ExitTradingId")) or options_data.get(f"{side}ExitPrice") is not None
+
+        pending = {}
+        if sell_symbol != "" and not exit_submitted("sell"):
+            pending["sell"] = sell_payload
+        if buy_symbol != "" and not exit_submitted("buy"):
+            pending["buy"] = buy_payload
+
+        intents = {"sell": "buy_to_close", "buy": "sell_to_close"}
+        use_mleg = (OPTIONS_EXECUTION_MODE == "mleg" and len(pending) == 2
+                    and sell_payload["qty"] == buy_payload["qty"])
+        if use_mleg:
+            executed = await execute_mleg_order(
+                alpaca, list(pending.values()), [intents[key] for key in pending], signal_order_id("close")
+            )
         else:
-            second_result_status = 200
-
-        if first_result_status == 200 and second_result_status == 200:
-            if first_trading_id != "":
-                url = "https://paper-api.alpaca.markets/v2/orders?status=all&symbols=" + sell_symbol
-                response = requests.get(url, headers=headers)
-                for order in response.json():
-                    if order["id"] == first_trading_id:
-                        print("***********sell_symbol", sell_symbol)
-                        price = order["filled_avg_price"]
-                        quantity = order["filled_qty"]
-                        sell_quantity = quantity
-                        sell_price = price
-                        break;
-            
-            if second_trading_id != "":
-                url = "https://paper-api.alpaca.markets/v2/orders?status=all&symbols=" + buy_symbol
-                response = requests.get(url, headers=headers)
-                for order in response.json():
-                    if order["id"] == second_trading_id:
-                        print("***********buy_symbol", buy_symbol)
-                        price = order["filled_avg_price"]
-                        quantity = order["filled_qty"]
-                        buy_quantity = quantity
-                        buy_price = price
-
-
-            options_collection = await get_database("optionsDatabase")
-            options_collection.update_one(
-                {"status" : "open"},
-                {"$set" : {"status" : "closed", "exitTimeStamp" : formatted_time,
-                           "sellSoldQuantity" : sell_quantity,
-                           "buySoldQuantity" : buy_quantity,
-                           "sellExitPrice" : sell_price,
-                           "buyExitPrice" : buy_price}}
+            executed = await execute_option_legs(alpaca, list(pending.values()))
+        legs = dict(zip(pending.keys(), executed))
+
+        update = {}
+        for side, leg in legs.items():
+            if leg["status"] == "submitted":
+                update[f"{side}ExitTradingId"] = leg["order_id"]
+                update[f"{side}SoldQuantity"] = leg["filled_qty"]
+                update[f"{side}ExitPrice"] = leg["filled_avg_price"]
+
+        result = legs_result(list(legs.values()))
+        # Closed once every opened leg has an exit order
+        opened = [side for side, symbol in (("sell", sell_symbol), ("buy", buy_symbol)) if symbol != ""]
+        if all(f"{side}ExitTradingId" in update or exit_submitted(side) for side in opened):
+            update["status"] = "closed"
+            update["exitTimeStamp"] = formatted_time
+        if use_mleg and result == "success":
+            update["exitOrderId"] = legs["sell"]["order_id"]
+
+        if update:
+            await options_collection.update_one(
+                {"_id": options_data["_id"]},
+                {"$set" : update}
             )
         logging.info(f"[{datetime.now()}] Sell order created for symbol: {sell_symbol}, quantity: {sell_quantity}")
         # return market_order
 
-        return {"message": "Sell order processed", "sell_result->": "success"}
+        return {"message": "Sell order processed", "sell_result->": result, "legs": list(legs.values())}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 async def current_time():
     try :
-        ntp_client = ntplib.NTPClient()
-        response = ntp_client.request('pool.ntp.org')
-        currentTime = datetime.fromtimestamp(response.tx_time, ZoneInfo("America/New_York"))
+        currentTime = clock.now()
         return currentTime.strftime("%Y-%m-%d %H:%M:%S %Z")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -428,27 +564,19 @@ async def create_short_stock_order(symbol, quantity, price):
         await stock_history_collection.insert_one(history_data)
         
         # Your existing order logic (currently commented out)
-        # Configure Alpaca credentials
-        alpaca_api = os.getenv("ALPACA_SHORT_STOCK_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SHORT_STOCK_SECRET_KEY")
-        url = "https://paper-api.alpaca.markets/v2/orders"
+        alpaca = get_alpaca_client("short_stock")
 
         payload = {
             "type": "market",
             "time_in_force": "gtc",
             "qty": quantity,
             "symbol": symbol,
-            "side": "buy"
+            "side": "buy",
+            "client_order_id": signal_order_id("buy"),
         }
         # print("payload", payload)
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
-        }
 
-        response = requests.post(url, json=payload, headers=headers)
+        response = await submit_order_with_retry(alpaca, payload)
 
         print(response.text)
         logging.info(f"[{datetime.now()}] Buy order created for symbol: {symbol}, quantity: {quantity}")
@@ -471,20 +599,9 @@ async def create_short_stock_sell_order(symbol, quantity, price):
         }
         await stock_history_collection.insert_one(history_data)
 
-        # Configure Alpaca credentials
-        alpaca_api = os.getenv("ALPACA_SHORT_STOCK_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SHORT_STOCK_SECRET_KEY")
-        
-
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
-        }
+        alpaca = get_alpaca_client("short_stock")
 
-        url = "https://paper-api.alpaca.markets/v2/positions"
-        response = requests.get(url, headers=headers)
+        response = await alpaca.get_positions()
         positions = response.json()
         qty = 0
         for position in positions:
@@ -494,17 +611,17 @@ async def create_short_stock_sell_order(symbol, quantity, price):
         
         # print("positions", positions)
         # print("quantity", qty)
-        url = "https://paper-api.alpaca.markets/v2/orders"
         
         payload = {
             "type": "market",
             "time_in_force": "gtc",
             "qty": qty,
             "symbol": symbol,
-            "side": "sell"
+            "side": "sell",
+            "client_order_id": signal_order_id("sell"),
         }
         
-        response = requests.post(url, json=payload, headers=headers)
+        response = await submit_order_with_retry(alpaca, payload)
 
         print(response.text)    
         logging.info(f"[{datetime.now()}] Sell order created for symbol: {symbol}, quantity: {quantity}")
@@ -517,34 +634,23 @@ async def create_short_stock_sell_order(symbol, quantity, price):
 @app.get("/account")
 async def get_account():
     logger.info(f"[{datetime.now()}] Account endpoint called")
+    return await account_cache.get_or_load("account", load_account)
 
-    # Configure Alpaca credentials
-    alpaca_api = os.getenv("ALPACA_API_KEY")
-    alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-    
-    url = "https://paper-api.alpaca.markets/v2/account/portfolio/history?intraday_reporting=market_hours&pnl_reset=per_day"
-
-    headers = {
-        "accept": "application/json",
-        "APCA-API-KEY-ID": alpaca_api,
-        "APCA-API-SECRET-KEY": alpaca_secret
-    }
-
-    response = requests.get(url, headers=headers)
+async def load_account():
+    alpaca = get_alpaca_client("stock")
 
+    # Fetch history, positions, orders and account at the same time
+    history_response, positions_response, myorders, account_response = await asyncio.gather(
+        alpaca.get_portfolio_history({"intraday_reporting": "market_hours", "pnl_reset": "per_day"}),
+        alpaca.get_positions(),
+        get_closed_orders("stock"),
+        alpaca.get_account(),
+    )
 
-    # print("myassets")
-    myassets = response.json()
-    url = "https://paper-api.alpaca.markets/v2/positions"
+    myassets = history_response.json()
+    myposition = positions_response.json()
+    account_info = account_response.json()
 
-    response = requests.get(url, headers=headers)
-
-    # print("myposition")
-    myposition = response.json()
-
-    # myorders = get_all_orders()
-    myorders = await get_all_orders()
-    # print("myorders")
     buyOrders = 0
     sellOrders = 0
     buyAmount = 0
@@ -558,17 +664,7 @@ async def get_account():
             sellOrders += 1
             sellAmount += float(order["filled_qty"])
 
-    # print("buyOrders", buyOrders)
-    # print("sellOrders", sellOrders)
-    # print("buyAmount", buyAmount)
-    # print("sellAmount", sellAmount)
-
-    url = "https://paper-api.alpaca.markets/v2/account"
-    response = requests.get(url, headers=headers)
-    print("response" , response.text)
-
-    account_info = response.json()
-    # Combine both responses into a single dictionary
+    # Combine all responses into a single dictionary
     combined_data = {
         "portfolio_history": myassets,
         "positions": myposition,
@@ -580,29 +676,16 @@ async def get_account():
         "sellAmount" : sellAmount
     }
 
-    # print("myposition" , myposition)
     return combined_data
 
 @app.get("/get_all_orders")
-async def get_all_orders():
+async def get_all_orders(request: Request, layout: Layout = "rows", fields: Optional[str] = None):
     try:
         print("get_all_orders")
         
-        CHUNK_SIZE = 1000
-        alpaca_api= os.getenv("ALPACA_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-        url = "https://paper-api.alpaca.markets/v2/orders?status=closed&limit=" + str(CHUNK_SIZE)
-        headers = {
-        "accept": "application/json",
-        "APCA-API-KEY-ID": alpaca_api,
-        "APCA-API-SECRET-KEY": alpaca_secret
-        }
-
-        response = requests.get(url, headers=headers)
-        # print(response.json())
-        # response = trading_client.get_orders()
-        orders = response.json()
-        return orders
+        # Read from the local order mirror, synced incrementally from the broker
+        orders = await get_closed_orders("stock")
+        return render(request, shape_rows(orders, layout, fields))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -611,131 +694,232 @@ async def test_endpoint():
     print("test")
     return {"message":"test url"}
 
+@app.get("/brokerQuota")
+async def broker_quota():
+    # Token bucket usage per account and API
+    return get_quota_metrics()
+
+@app.websocket("/ws/quotes")
+async def quotes_websocket(websocket: WebSocket):
+    """
+    Live quotes for stock and OCC option symbols. Clients send
+    {"action": "subscribe" | "unsubscribe", "symbols": [...]} and receive
+    {"type": "quotes", "data": [...]} batches.
+    """
+    await websocket.accept()
+    hub = get_quote_hub()
+    subscriber = QuoteSubscriber(websocket)
+    sender = asyncio.create_task(subscriber.run_sender())
+    try:
+        while True:
+            message = await websocket.receive_json()
+            action = message.get("action")
+            symbols = [str(symbol).upper() for symbol in message.get("symbols", [])]
+            try:
+                if action == "subscribe":
+                    await hub.subscribe(subscriber, symbols)
+                elif action == "unsubscribe":
+                    await hub.unsubscribe(subscriber, symbols)
+                else:
+                    raise ValueError(f"Unknown action: {action}")
+            except (ValueError, RuntimeError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+            except (websockets.ConnectionClosed, OSError) as e:
+                # The symbols stay registered; the stream re-subscribes them when it reconnects
+                logger.warning(f"Quote upstream unavailable during {action}: {str(e)}")
+                await websocket.send_json({"type": "error", "detail": "Quote stream reconnecting", "retrying": True})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"Quote websocket closed: {str(e)}")
+    finally:
+        sender.cancel()
+        await hub.remove(subscriber)
+
+@app.get("/quoteHub")
+async def quote_hub_metrics():
+    return get_quote_hub().get_metrics()
+
 class stockSignal(BaseModel):
     order : str
     symbol : str
     qty : int
+    signalId : Optional[str] = None
+
+async def queued_signal_response(response, signal_id, state):
+    if state == "queued":
+        return {"message": "Signal queued", "signalId": signal_id}
+
+    # Processed inline, or a retried webhook getting the original signal's
+    # outcome without touching the broker
+    response.status_code = 200
+    original = await get_signal(ObjectId(signal_id)) or {}
+    return {
+        "message": "Duplicate signal" if state == "duplicate" else "Signal processed",
+        "signalId": signal_id,
+        "status": original.get("status"),
+        "result": original.get("result"),
+        "error": original.get("error"),
+    }
 
 # for stock trading
-@app.post("/signal")
-async def receive_signal(signal_request: stockSignal):
+@app.post("/signal", status_code=202)
+async def receive_signal(signal_request: stockSignal, response: Response):
     print("signal_request", signal_request)
     try:
-        startStopSettingsCollection = await get_database("startStopSettings")
-        startStopSettings = await startStopSettingsCollection.find_one({})
+        startStopSettings = await get_cached_start_stop_settings()
         stock_start = startStopSettings["stockStart"]
-        options_start = startStopSettings["optionsStart"]
         if stock_start == False:
             return {"message": "Stock trading is not started"}
-        
-        settings = await get_settings()
-        stock_amount = signal_request.qty
-        
-        # Handle buy signals
-        if signal_request.order == 'buy':
-            check_position = await check_open_position()
-            if check_position == False:
-                symbol = signal_request.symbol  # Remove quotes from symbol
-                price = signal_request.price
-                # global check_in_order_status
-                # check_in_order_status = True
-                print("symbol", symbol)
-                # Your buy order logic here
-                result = await create_order(symbol,stock_amount)
-                return {"message": "Buy order processed", "buy_result->": result}
-            else:
-                return {"message": "Buy order already processed", "buy_result->": "already_processed"}
-        
-        # Handle sell signals
-        elif signal_request.order == 'sell':
-            # Your sell order logic here
-            # print("sellOrder--------->occured")
-            symbol = signal_request.symbol  # Remove quotes from symbol
-            price = signal_request.price
-            result = await create_sell_order(symbol,stock_amount)
-            return {"message": "Sell order processed", "sell_result->": result}
-            
-        return {"message": "Signal received", "data": signal_request}
+
+        if signal_request.order not in ("buy", "sell"):
+            return {"message": "Signal received", "data": signal_request}
+
+        # The stock strategy tracks one position in module state (symbol,
+        # entry_price, order_id), so stock signals run in a single lane
+        signal_id, state = await enqueue_signal(
+            "stock", "stock", signal_request.model_dump(exclude={"signalId"}), signal_request.signalId
+        )
+        return await queued_signal_response(response, signal_id, state)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+async def process_stock_signal(payload):
+    # Trading may have been stopped while the signal waited in the queue
+    startStopSettings = await get_cached_start_stop_settings()
+    if startStopSettings["stockStart"] == False:
+        return {"message": "Stock trading is not started"}
+
+    signal_request = stockSignal(**payload)
+    settings = await get_settings()
+    stock_amount = signal_request.qty
+    symbol = signal_request.symbol
+
+    # Handle buy signals
+    if signal_request.order == 'buy':
+        check_position = await check_open_position()
+        if check_position == False:
+            print("symbol", symbol)
+            result = await create_order(symbol,stock_amount,settings)
+            return {"message": "Buy order processed", "buy_result->": result}
+        else:
+            return {"message": "Buy order already processed", "buy_result->": "already_processed"}
+
+    # Handle sell signals
+    result = await create_sell_order(symbol,stock_amount)
+    return {"message": "Sell order processed", "sell_result->": result}
+
+register_handler("stock", process_stock_signal)
+register_handler("shortStock", process_short_stock_signal)
+register_handler("options", process_options_signal)
+
+@app.get("/signalQueue")
+async def signal_queue_metrics():
+    # Queue depth and queued / processing / total latency in seconds
+    return get_queue_metrics()
+
+@app.get("/signalStatus/{signal_id}")
+async def signal_status(signal_id: str):
+    if not ObjectId.is_valid(signal_id):
+        raise HTTPException(status_code=400, detail="Invalid signal id")
+    signal = await get_signal(ObjectId(signal_id))
+    if signal is None:
+        raise HTTPException(status_code=404, detail="Signal not found")
+    signal["_id"] = str(signal["_id"])
+    return signal
+
 @app.get("/test")
 async def test_endpoint():
     print("test")
     return {"message":"test url"}
 
-async def create_order(symbol, quantity):
+async def await_order_fill(account, order_id, params=None, timeout=ORDER_FILL_TIMEOUT):
+    """
+    Wait for the terminal update of an order from the trade_updates stream.
+    Falls back to polling the order directly when the stream is not
+    connected, drops, or the update does not arrive in time. Both share
+    one `timeout`; polling always looks the order up at least once.
+    """
+    deadline = time.monotonic() + timeout
+    stream = get_trade_updates_stream(account)
+    if stream.connected:
+        try:
+            order = await stream.wait_for_fill(order_id, timeout)
+            # With params (e.g. nested legs) the terminal order is fetched once more below
+            if params is None:
+                return order
+        except asyncio.TimeoutError:
+            print(f"No trade update for order {order_id}, polling")
+        except ConnectionError as e:
+            print(f"Trade updates stream lost waiting for order {order_id}, polling: {str(e)}")
+
+    remaining = max(0.0, deadline - time.monotonic())
+    fill = await track_fill(get_alpaca_client(account), order_id, params, timeout=remaining)
+    logger.info(f"Order {order_id} {fill['status']} after {fill['polls']} polls in {fill['elapsed']:.3f}s")
+    return fill["order"]
+
+async def create_order(symbol, quantity, settings=None):
     try:
         global entry_price  # Add this line to access the global variable
         stock_history_collection = await get_database("stockHistory")
-        settings_collection = await get_database("settings")
-        settings = await settings_collection.find_one({})
+        if settings is None:
+            settings = await get_cached_settings()
         stock_amount = settings["stockAmount"]
         formatted_time = await current_time() 
-        alpaca_api = os.getenv("ALPACA_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-
-        url = "https://paper-api.alpaca.markets/v2/orders"
+        alpaca = get_alpaca_client("stock")
 
         payload = {
             "type": "market",
             "time_in_force": "day",
             "symbol": symbol,
             "qty": stock_amount,
-            "side": "buy"
-        }
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
+            "side": "buy",
+            "client_order_id": signal_order_id("buy"),
         }
 
-        response = requests.post(url, json=payload, headers=headers)
+        response = await submit_order_with_retry(alpaca, payload)
+        if response.status_code != 200:
+            print(f"Buy order for {symbol} failed: {response.text}")
+            return None
         tradingId = response.json()["id"]
 
 
         if tradingId != "":
-            await asyncio.sleep(1.5)
-            url2 = "https://paper-api.alpaca.markets/v2/orders?status=all&symbols="+symbol
-            response2 = requests.get(url2, headers=headers)
-
-            for order in response2.json():
-                if order["id"] == tradingId:
-                    price = order["filled_avg_price"]
-                    buy_quantity = order["filled_qty"]
-                    entrytimestamp = order["filled_at"]
-                    entry_price = float(price)  # This will now update the global variable
-                    global updated_entry_price
-                    updated_entry_price = float(price)
-
-                    stop_loss_price = round((updated_entry_price * (1 - lose_percent/100)), 2)
-                    take_profit_price = round(updated_entry_price * (1 + profit_percent/100), 2)
-
-                    print("entry_price", entry_price)
-                    print("stop_loss_price", stop_loss_price)
-                    print("take_profit_price", take_profit_price)
-
-                    # await execute_limit_order(symbol, stop_loss_price, take_profit_price)
-                    # global check_in_order_status
-                    # check_in_order_status = False
-                    
-                    history_data = {
-                        "symbol": symbol,
-                        "quantity": buy_quantity,
-                        "entryPrice": price,
-                        "exitPrice": 0,
-                        "type": "BUY",
-                        "tradingId": tradingId,
-                        "tradingType" : "auto",
-                        "status": "open",
-                        "entrytimestamp": entrytimestamp,
-                        "exitTimestamp": None
-                    }
-                    print("buy order is excuted" , entry_price)
-                                
-                    await stock_history_collection.insert_one(history_data)
-                    break;
+            order = await await_order_fill("stock", tradingId)
+            if order is not None and order.get("filled_avg_price") is not None:
+                price = order["filled_avg_price"]
+                buy_quantity = order["filled_qty"]
+                entrytimestamp = order["filled_at"]
+                entry_price = float(price)  # This will now update the global variable
+                global updated_entry_price
+                updated_entry_price = float(price)
+
+                stop_loss_price = round((updated_entry_price * (1 - lose_percent/100)), 2)
+                take_profit_price = round(updated_entry_price * (1 + profit_percent/100), 2)
+
+                print("entry_price", entry_price)
+                print("stop_loss_price", stop_loss_price)
+                print("take_profit_price", take_profit_price)
+
+                # await execute_limit_order(symbol, stop_loss_price, take_profit_price)
+                # global check_in_order_status
+                # check_in_order_status = False
+                
+                history_data = {
+                    "symbol": symbol,
+                    "quantity": buy_quantity,
+                    "entryPrice": price,
+                    "exitPrice": 0,
+                    "type": "BUY",
+                    "tradingId": tradingId,
+                    "tradingType" : "auto",
+                    "status": "open",
+                    "entrytimestamp": entrytimestamp,
+                    "exitTimestamp": None
+                }
+                print("buy order is excuted" , entry_price)
+                            
+                await stock_history_collection.insert_one(history_data)
             
 
                     
@@ -758,8 +942,6 @@ async def create_sell_order(symbol , stock_amount):
         stock_history_collection = await get_database("stockHistory")
         stock_history = await stock_history_collection.find_one({"symbol": symbol, "status": "open" , "tradingType" : "auto"})
         
-        settings_collection = await get_database("settings")
-        settings = await settings_collection.find_one({})
         # stock_amount = settings["stockAmount"]
         
         if not stock_history:
@@ -767,52 +949,37 @@ async def create_sell_order(symbol , stock_amount):
 
         tradingId = stock_history["tradingId"]
 
-        # Configure Alpaca credentials
-        alpaca_api = os.getenv("ALPACA_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-        url = "https://paper-api.alpaca.markets/v2/orders"
+        alpaca = get_alpaca_client("stock")
 
         payload = {
             "type": "market",
             "time_in_force": "day",
             "symbol": stock_history["symbol"],
             "qty": stock_amount,
-            "side": "sell"
+            "side": "sell",
+            "client_order_id": signal_order_id("sell"),
         }
         # print("payload", payload)
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
-        }
 
-        response = requests.post(url, json=payload, headers=headers)
-        tradingId = response.json()["id"]
+        response = await submit_order_with_retry(alpaca, payload)
         # print("response", response.json())
         # print("tradingId", tradingId)
         
         if response.status_code == 200:
-            await asyncio.sleep(3)
-            url = "https://paper-api.alpaca.markets/v2/orders?status=all&symbols="+symbol
-            # url = "https://paper-api.alpaca.markets/v2/orders?status=all&symbols=" + stock_history["symbol"]
-
-            # print("url", url)
-            response = requests.get(url, headers=headers)
+            tradingId = response.json()["id"]
             price = 0
-            for order in response.json():
-                if order["id"] == tradingId:
-                    price = order["filled_avg_price"]
-                    
-                    exitTimestamp = order["filled_at"] 
-                    # print("----------------------------", price)
-                    print("sell order is excuted" , price)
-                    await stock_history_collection.update_one(
-                        {"symbol": symbol, "status": "open" , "tradingType" : "auto" },
-                        {"$set": {"status": "closed" , "exitPrice" : price , "exitTimestamp" : exitTimestamp}}
-                    )
-                    return {"message": "Sell order processed successfully", "status": "success", "exitPrice": price}
-                break;
+            order = await await_order_fill("stock", tradingId)
+            if order is not None:
+                price = order["filled_avg_price"]
+                
+                exitTimestamp = order["filled_at"] 
+                # print("----------------------------", price)
+                print("sell order is excuted" , price)
+                await stock_history_collection.update_one(
+                    {"symbol": symbol, "status": "open" , "tradingType" : "auto" },
+                    {"$set": {"status": "closed" , "exitPrice" : price , "exitTimestamp" : exitTimestamp}}
+                )
+                return {"message": "Sell order processed successfully", "status": "success", "exitPrice": price}
         
         return {"message": "Failed to process sell order", "status": "error"}
         
@@ -923,6 +1090,7 @@ async def saveSettings(settings: Settings):
     try:
         settings_collection = await get_database("settings")
         await settings_collection.update_one({}, {"$set": settings.model_dump()}, upsert=True)
+        await refresh_settings()
         return 200
     except Exception as e:  
         raise HTTPException(status_code=500, detail=str(e))
@@ -936,6 +1104,7 @@ async def saveProfitLossSettings(settings: ProfitLossSettings):
     try:
         settings_collection = await get_database("settings")
         await settings_collection.update_one({}, {"$set": settings.model_dump()}, upsert=True)
+        await refresh_settings()
         # Update global variables
         await update_profit_loss_from_db()
         return 200
@@ -950,6 +1119,7 @@ async def changeStockTradingStart(start: StartStopSettings):
     try:
         settings_collection = await get_database("startStopSettings")
         await settings_collection.update_one({}, {"$set": {"stockStart": start.stockStart}}, upsert=True)
+        await refresh_settings()
         return 200
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -962,21 +1132,14 @@ async def changeOptionsTradingStart(start: OptionsStartStopSettings):
     try:
         settings_collection = await get_database("startStopSettings")
         await settings_collection.update_one({}, {"$set": {"optionsStart": start.optionsStart}}, upsert=True)
+        await refresh_settings()
         return 200
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 async def auto_sell_options(option_symbol , left_amount):
     try:
-        api_key = os.getenv("ALPACA_OPTIONS_API_KEY")
-        api_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
-        headers = {
-            "APCA-API-KEY-ID": api_key,
-            "APCA-API-SECRET-KEY": api_secret,
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        url = "https://paper-api.alpaca.markets/v2/orders"
+        alpaca = get_alpaca_client("options")
 
         side = "sell"
         if left_amount < 0:
@@ -992,25 +1155,23 @@ async def auto_sell_options(option_symbol , left_amount):
             "side": side,
         }
         print("payload", payload)
-        response = requests.post(url, headers=headers, json=payload)
+        response = await alpaca.submit_order(payload)
         return response.json()
     except Exception as e:
         print(f"Error in auto sell options: {e}")
 
 
 async def check_market_time():
-    try:
-        # Get time from NTP server
-        ntp_client = ntplib.NTPClient()
-        response = ntp_client.request('pool.ntp.org')
-        # Convert NTP time to datetime and set timezone to ET
-        current_time = datetime.fromtimestamp(response.tx_time, ZoneInfo("America/New_York"))
-    except Exception as e:
-        print(f"Error getting NTP time: {e}")
-        # Fallback to local time if NTP fails
-        current_time = datetime.now(ZoneInfo("America/New_York"))
+    # NTP-corrected time in ET, no network call
+    current_time = clock.now()
 
     print("current_time: ", current_time)
+
+    try:
+        # Holidays and early closes come from the bundled session table
+        return get_market_calendar().is_open(current_time)
+    except ValueError as e:
+        print(f"{e}, using regular hours")
     
     # Check if it's a weekday (0 = Monday, 6 = Sunday)
     if current_time.weekday() >= 5:  # Saturday or Sunday
@@ -1027,23 +1188,15 @@ async def check_market_time():
 async def check_date_expired(option_symbol , left_amount):
     try:
         print("options symbol" , option_symbol)
-        month, date = parse_option_date(option_symbol)
-        try:
-            # Get time from NTP server
-            ntp_client = ntplib.NTPClient()
-            response = ntp_client.request('pool.ntp.org')
-            # Convert NTP time to datetime and set timezone to ET
-            current_time = datetime.fromtimestamp(response.tx_time, ZoneInfo("America/New_York"))
-        except Exception as e:
-            print(f"Error getting NTP time: {e}")
-            # Fallback to local time if NTP fails
-            current_time = datetime.now(ZoneInfo("America/New_York"))
+        expiry = parse_option_symbol(option_symbol).expiry
+        current_time = clock.now()
             
-        # Create expiration date object (40 minutes before market close)
-        expiration_date = current_time.replace(month=int(month), day=int(date), hour=15, minute=20, second=0, microsecond=0)
+        # Create expiration date object (40 minutes before the expiry session closes)
+        session = get_market_calendar().expiry_session(expiry)
+        expiration_date = session[1] - EXPIRY_EXIT_LEAD
         
         # Check if current time is on expiration date and 40 minutes before close
-        if current_time.date() == expiration_date.date() and current_time >= expiration_date:
+        if expiry_exit_due(expiry, current_time):
             print(f"Option {option_symbol} is 40 minutes before market close on expiration date")
             await auto_sell_options(option_symbol , left_amount)
             return True
@@ -1060,7 +1213,6 @@ async def execute_limit_order(symbol, stop_loss_price, take_profit_price):
     try:
         global order_id
         result = await remove_limit_order()
-        url = "https://paper-api.alpaca.markets/v2/orders"
         payload = {
             "type": "stop",
             "time_in_force": "day",
@@ -1069,16 +1221,8 @@ async def execute_limit_order(symbol, stop_loss_price, take_profit_price):
             "side": "sell",
             "stop_price": stop_loss_price
         }
-        ALPACA_API_KEY = os.getenv("ALPACA_API_KEY")
-        ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/json",
-            "APCA-API-KEY-ID": ALPACA_API_KEY,
-            "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
-        }
-        print("===========headers======", headers)
-        response = requests.post(url, headers=headers, json=payload)
+        alpaca = get_alpaca_client("stock")
+        response = await alpaca.submit_order(payload)
         
         if response.status_code != 200:
             print(f"Failed to create order. Status code: {response.status_code}")
@@ -1100,17 +1244,9 @@ async def execute_limit_order(symbol, stop_loss_price, take_profit_price):
 async def remove_limit_order():
     try:
         global order_id
-        url = "https://paper-api.alpaca.markets/v2/orders"
-        ALPACA_API_KEY = os.getenv("ALPACA_API_KEY")
-        ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/json",
-            "APCA-API-KEY-ID": ALPACA_API_KEY,
-            "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
-        }
+        alpaca = get_alpaca_client("stock")
 
-        response = requests.delete(url, headers=headers)
+        response = await alpaca.cancel_all_orders()
         return {"status": "success"}
     except Exception as e: 
         print(f"Error in remove limit order: {e}")
@@ -1120,17 +1256,9 @@ async def remove_limit_order():
 async def check_open_position():
     try:
         global symbol
-        ALPACA_API_KEY = os.getenv("ALPACA_API_KEY")
-        ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
-        headers = {
-            "accept": "application/json",
-            "Content-Type": "application/json",
-            "APCA-API-KEY-ID": ALPACA_API_KEY,
-            "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
-        }
-        url = "https://paper-api.alpaca.markets/v2/positions/" + symbol
+        alpaca = get_alpaca_client("stock")
 
-        response = requests.get(url, headers=headers)
+        response = await alpaca.get_position(symbol)
         # print("response", response.json())
         if response.status_code == 200:
             return True
@@ -1162,6 +1290,14 @@ async def stop_sell(stopSell: StopSell):
         print(f"Error in check open position: {e}")
         return None
 
+@app.post("/sweepExpiringOptions")
+async def sweep_expiring_options_now():
+    try:
+        # Manual run of the scheduled sweep, ignoring the pre-close gate
+        return await sweep_expiring_options(force=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/startSell")
 async def start_sell():
     global all_sell_stop
@@ -1175,7 +1311,6 @@ async def sell_all_directly():
     all_sell_stop = True
     await remove_limit_order()
 
-    url = "https://paper-api.alpaca.markets/v2/orders"
     payload = {
         "type": "market",
         "time_in_force": "day",
@@ -1183,16 +1318,8 @@ async def sell_all_directly():
         "qty": "100",
         "side": "sell",
     }
-    ALPACA_API_KEY = os.getenv("ALPACA_API_KEY")
-    ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
-    headers = {
-        "accept": "application/json",
-        "Content-Type": "application/json",
-        "APCA-API-KEY-ID": ALPACA_API_KEY,
-        "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
-    }
-    print("===========headers======", headers)
-    response = requests.post(url, headers=headers, json=payload)
+    alpaca = get_alpaca_client("stock")
+    response = await alpaca.submit_order(payload)
     all_sell_stop = False
     print("all_sell_stop", all_sell_stop)
     return "OK"
@@ -1224,17 +1351,8 @@ async def check_funtion():
             number_of_times += 1
             print("================entry_price=========", entry_price)
             
-            url = "https://paper-api.alpaca.markets/v2/positions/" + symbol
-
-            ALPACA_API_KEY = os.getenv("ALPACA_API_KEY")
-            ALPACA_SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
-
-            headers = {
-                "accept": "application/json",
-                "APCA-API-KEY-ID": ALPACA_API_KEY,
-                "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
-            }
-            response = requests.get(url, headers=headers)
+            alpaca = get_alpaca_client("stock")
+            response = await alpaca.get_position(symbol)
             bid_price = response.json()["current_price"]
             
 
@@ -1260,8 +1378,6 @@ async def check_funtion():
         print(f"Error in function: {str(e)}")
         return "Error occurred"
 
-scheduler = AsyncIOScheduler()
-
 # @app.on_event("startup")
 # async def start_scheduler():
 #     scheduler.start()
@@ -1303,10 +1419,7 @@ class BuyOrder(BaseModel):
 async def buy_order(buyOrder: BuyOrder):
     try:        
         print("buyOrder", buyOrder)
-        alpaca_api = os.getenv("ALPACA_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-
-        url = "https://paper-api.alpaca.markets/v2/orders"
+        alpaca = get_alpaca_client("stock")
 
         payload = {
             "type": "market",
@@ -1315,14 +1428,8 @@ async def buy_order(buyOrder: BuyOrder):
             "qty": buyOrder.qty,
             "side": "buy"
         }
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
-        }
 
-        response = requests.post(url, json=payload, headers=headers)
+        response = await alpaca.submit_order(payload)
         print("response", response.json())
         if response.status_code == 200:
             return "Buy order created successfully"
@@ -1339,10 +1446,7 @@ class SellOrder(BaseModel):
 @app.post("/sellOrder")
 async def sell_order(sellOrder: SellOrder):
     try:        
-        alpaca_api = os.getenv("ALPACA_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-
-        url = "https://paper-api.alpaca.markets/v2/orders"
+        alpaca = get_alpaca_client("stock")
 
         payload = {
             "type": "market",
@@ -1351,14 +1455,8 @@ async def sell_order(sellOrder: SellOrder):
             "qty": sellOrder.qty,
             "side": "sell"
         }
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": alpaca_api,
-            "APCA-API-SECRET-KEY": alpaca_secret
-        }
 
-        response = requests.post(url, json=payload, headers=headers)
+        response = await alpaca.submit_order(payload)
         print("response", response.json())
         if response.status_code == 200:
             return "Sell order created successfully"
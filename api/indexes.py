@@ -0,0 +1,173 @@
+from pymongo import ASCENDING, DESCENDING
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Indexes created at startup, keyed by collection name
+INDEXES = {
+    "stockHistory": [
+        # create_sell_order: find_one/update_one({"symbol", "status", "tradingType"})
+        {"keys": [("symbol", ASCENDING), ("status", ASCENDING), ("tradingType", ASCENDING)],
+         "name": "symbol_status_tradingType"},
+        # /api/trader/profitLoss: find({"status": "closed"}).sort("exitTimestamp", -1)
+        {"keys": [("status", ASCENDING), ("exitTimestamp", DESCENDING)],
+         "name": "status_exitTimestamp"},
+    ],
+    "optionsDatabase": [
+        # create_options_sell_order: find_one({"status": "open"}) uses the status prefix;
+        # mark_swept_spreads: update_many({"status", "sell_symbol" | "buy_symbol"})
+        {"keys": [("status", ASCENDING), ("sell_symbol", ASCENDING)], "name": "status_sell_symbol"},
+        {"keys": [("status", ASCENDING), ("buy_symbol", ASCENDING)], "name": "status_buy_symbol"},
+    ],
+    "brokerOrders": [
+        # order_sync upserts by broker order id
+        {"keys": [("account", ASCENDING), ("id", ASCENDING)], "name": "account_id_unique", "unique": True},
+        # get_closed_orders / update_watermark read an account's orders by submission time;
+        # refresh_open_orders uses the account prefix
+        {"keys": [("account", ASCENDING), ("submittedAt", DESCENDING)], "name": "account_submittedAt"},
+    ],
+    "orderSyncState": [
+        {"keys": [("account", ASCENDING)], "name": "account_unique", "unique": True},
+    ],
+    "signalQueue": [
+        # signal_queue recovery: update_many({"status"}) and find({"status"}).sort("_id", 1)
+        {"keys": [("status", ASCENDING), ("_id", ASCENDING)], "name": "status_id"},
+    ],
+    "signalFingerprints": [
+        # Dedup claims are keyed by _id; each document is removed at its expiresAt
+        {"keys": [("expiresAt", ASCENDING)], "name": "expiresAt_ttl", "expireAfterSeconds": 0},
+    ],
+    "traders": [
+        # signup / signin / verify / changePassword look traders up by email
+        {"keys": [("email", ASCENDING)], "name": "email_unique", "unique": True},
+    ],
+}
+
+# Every query in api/, by the module.function that runs it. `filter` holds
+# the equality fields and `sort` the sort keys; range, $in and $nin
+# conditions are checked after the index lookup and are not listed.
+# tests/test_indexes.py fails when a query call site has no entry here.
+QUERY_PATTERNS = [
+    {"collection": "stockHistory", "filter": ["symbol", "status", "tradingType"], "sort": [],
+     "where": "index.create_sell_order"},
+    {"collection": "stockHistory", "filter": ["status"], "sort": [("exitTimestamp", DESCENDING)],
+     "where": "routes.brokerage.get_history_data"},
+    {"collection": "optionsDatabase", "filter": ["status"], "sort": [],
+     "where": "index.create_options_sell_order"},
+    {"collection": "optionsDatabase", "filter": ["_id"], "sort": [],
+     "where": "index.create_options_sell_order"},
+    {"collection": "optionsDatabase", "filter": ["status", "sell_symbol"], "sort": [],
+     "where": "expiry_sweeper.mark_swept_spreads"},
+    {"collection": "optionsDatabase", "filter": ["status", "buy_symbol"], "sort": [],
+     "where": "expiry_sweeper.mark_swept_spreads"},
+    {"collection": "optionsDatabase", "filter": ["status"], "sort": [],
+     "where": "expiry_sweeper.mark_swept_spreads"},
+    {"collection": "brokerOrders", "filter": ["account", "id"], "sort": [],
+     "where": "order_sync.write_orders"},
+    {"collection": "brokerOrders", "filter": ["account"], "sort": [("submittedAt", DESCENDING)],
+     "where": "order_sync.get_closed_orders"},
+    {"collection": "brokerOrders", "filter": ["account"], "sort": [],
+     "where": "order_sync.refresh_open_orders"},
+    {"collection": "brokerOrders", "filter": ["account"], "sort": [("submittedAt", DESCENDING)],
+     "where": "order_sync.update_watermark"},
+    {"collection": "orderSyncState", "filter": ["account"], "sort": [],
+     "where": "order_sync.get_watermark"},
+    {"collection": "orderSyncState", "filter": ["account"], "sort": [],
+     "where": "order_sync.update_watermark"},
+    {"collection": "signalQueue", "filter": ["status"], "sort": [],
+     "where": "signal_queue._recover"},
+    {"collection": "signalQueue", "filter": ["status"], "sort": [("_id", ASCENDING)],
+     "where": "signal_queue._recover"},
+    {"collection": "signalQueue", "filter": ["_id"], "sort": [],
+     "where": "signal_queue._update"},
+    {"collection": "signalQueue", "filter": ["_id"], "sort": [],
+     "where": "signal_queue.get_signal"},
+    {"collection": "signalFingerprints", "filter": ["_id"], "sort": [],
+     "where": "signal_dedup.claim"},
+    {"collection": "signalFingerprints", "filter": ["_id", "signalId"], "sort": [],
+     "where": "signal_dedup.release"},
+    {"collection": "traders", "filter": ["email"], "sort": [],
+     "where": "routes.auth.create_trader"},
+    {"collection": "traders", "filter": ["email"], "sort": [],
+     "where": "routes.auth.signin"},
+    {"collection": "traders", "filter": ["email"], "sort": [],
+     "where": "routes.auth.verify_token"},
+    {"collection": "traders", "filter": ["email"], "sort": [],
+     "where": "routes.auth.changePassword"},
+    {"collection": "traders", "filter": ["_id"], "sort": [],
+     "where": "routes.trader.update_brokerage"},
+    {"collection": "brokerageCollection", "filter": ["_id"], "sort": [],
+     "where": "routes.brokerage.delete_brokerage"},
+    # Whole-collection reads and single-document settings collections
+    {"collection": "traders", "filter": [], "sort": [], "where": "index.get_items"},
+    {"collection": "traders", "filter": [], "sort": [], "where": "routes.trader.get_traders"},
+    {"collection": "analyst", "filter": [], "sort": [], "where": "routes.trader.get_analysts"},
+    {"collection": "brokerageCollection", "filter": [], "sort": [], "where": "routes.brokerage.get_brokerages"},
+    {"collection": "settings", "filter": [], "sort": [], "where": "index.getSettings"},
+    {"collection": "settings", "filter": [], "sort": [], "where": "index.saveSettings"},
+    {"collection": "settings", "filter": [], "sort": [], "where": "index.saveProfitLossSettings"},
+    {"collection": "settings", "filter": [], "sort": [], "where": "settings_cache.refresh_settings"},
+    {"collection": "startStopSettings", "filter": [], "sort": [], "where": "index.getStartStopSettings"},
+    {"collection": "startStopSettings", "filter": [], "sort": [], "where": "index.changeStockTradingStart"},
+    {"collection": "startStopSettings", "filter": [], "sort": [], "where": "index.changeOptionsTradingStart"},
+    {"collection": "startStopSettings", "filter": [], "sort": [], "where": "settings_cache.refresh_settings"},
+]
+
+def index_covers(keys, filter_fields, sort_fields):
+    """
+    An index serves a query when the equality fields form a prefix of its
+    keys (in any order) and the sort fields follow in the same or fully
+    reversed direction.
+    """
+    equality = set(filter_fields)
+    prefix = keys[:len(equality)]
+    if {field for field, _ in prefix} != equality:
+        return False
+
+    rest = keys[len(equality):len(equality) + len(sort_fields)]
+    if len(rest) < len(sort_fields):
+        return False
+    if [field for field, _ in rest] != [field for field, _ in sort_fields]:
+        return False
+    forward = all(a == b for (_, a), (_, b) in zip(rest, sort_fields))
+    backward = all(a == -b for (_, a), (_, b) in zip(rest, sort_fields))
+    return forward or backward
+
+def find_unindexed_queries(indexes=None, patterns=None):
+    """
+    Return every query pattern that no registered index can serve.
+    """
+    indexes = INDEXES if indexes is None else indexes
+    patterns = QUERY_PATTERNS if patterns is None else patterns
+
+    missing = []
+    for pattern in patterns:
+        # _id is always indexed and unique; an unfiltered query reads the whole collection anyway
+        if "_id" in pattern["filter"] or not (pattern["filter"] or pattern["sort"]):
+            continue
+        candidates = indexes.get(pattern["collection"], [])
+        if not any(index_covers(index["keys"], pattern["filter"], pattern["sort"]) for index in candidates):
+            missing.append(pattern)
+    return missing
+
+async def ensure_indexes(db):
+    for collection_name, specs in INDEXES.items():
+        collection = db.get_collection(collection_name)
+        for spec in specs:
+            try:
+                options = {"expireAfterSeconds": spec["expireAfterSeconds"]} if "expireAfterSeconds" in spec else {}
+                await collection.create_index(
+                    spec["keys"],
+                    name=spec["name"],
+                    unique=spec.get("unique", False),
+                    **options,
+                )
+            except Exception as e:
+                # A unique index fails if duplicates already exist; keep serving
+                logger.error(f"Failed to create index {collection_name}.{spec['name']}: {str(e)}")
+
+    for pattern in find_unindexed_queries():
+        logger.warning(
+            f"Query on {pattern['collection']} filter={pattern['filter']} "
+            f"sort={pattern['sort']} ({pattern['where']}) has no supporting index"
+        )
@@ -0,0 +1,122 @@
+"""
+Market session calendar loaded once from api/data/market_calendar.json.
+Sessions are stored in arrays indexed by day, so every query is a couple
+of list lookups with no network I/O.
+"""
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_FILE = os.path.join(os.path.dirname(__file__), "data", "market_calendar.json")
+
+class MarketCalendar:
+    def __init__(self, path=CALENDAR_FILE):
+        with open(path) as f:
+            config = json.load(f)
+
+        self.tz = ZoneInfo(config["timezone"])
+        self.start = date.fromisoformat(config["start"])
+        self.end = date.fromisoformat(config["end"])
+        regular_open = time.fromisoformat(config["regular_open"])
+        regular_close = time.fromisoformat(config["regular_close"])
+        early_close = time.fromisoformat(config["early_close"])
+        holidays = {date.fromisoformat(day) for day in config["holidays"]}
+        early_closes = {date.fromisoformat(day) for day in config["early_closes"]}
+
+        days = (self.end - self.start).days + 1
+        self._first = self.start.toordinal()
+
+        # Session open/close epoch seconds, in trading-day order
+        self.opens = []
+        self.closes = []
+        # Per calendar day: its session index (-1 when closed), the next
+        # session on or after it and the last session on or before it
+        self._session_of_day = [-1] * days
+        self._next_session = [-1] * (days + 1)
+        self._prev_session = [-1] * days
+
+        for offset in range(days):
+            day = self.start + timedelta(days=offset)
+            if day.weekday() < 5 and day not in holidays:
+                close = early_close if day in early_closes else regular_close
+                self._session_of_day[offset] = len(self.opens)
+                self.opens.append(datetime.combine(day, regular_open, self.tz).timestamp())
+                self.closes.append(datetime.combine(day, close, self.tz).timestamp())
+            self._prev_session[offset] = len(self.opens) - 1
+
+        next_session = -1
+        for offset in range(days - 1, -1, -1):
+            if self._session_of_day[offset] != -1:
+                next_session = self._session_of_day[offset]
+            self._next_session[offset] = next_session
+
+    def _day_index(self, day):
+        index = day.toordinal() - self._first
+        if index < 0 or index >= len(self._session_of_day):
+            raise ValueError(f"{day} is outside the market calendar ({self.start} to {self.end})")
+        return index
+
+    def _local(self, at):
+        return at.astimezone(self.tz)
+
+    def session(self, day):
+        """(open, close) datetimes of the session on `day`, or None if closed."""
+        index = self._session_of_day[self._day_index(day)]
+        if index == -1:
+            return None
+        return (datetime.fromtimestamp(self.opens[index], self.tz),
+                datetime.fromtimestamp(self.closes[index], self.tz))
+
+    def is_open(self, at):
+        local = self._local(at)
+        index = self._session_of_day[self._day_index(local.date())]
+        if index == -1:
+            return False
+        return self.opens[index] <= at.timestamp() < self.closes[index]
+
+    def next_open(self, at):
+        """Open of the next session that has not opened yet."""
+        local = self._local(at)
+        day_index = self._day_index(local.date())
+        index = self._next_session[day_index]
+        if index != -1 and self.opens[index] <= at.timestamp():
+            index += 1
+        if index == -1 or index >= len(self.opens):
+            return None
+        return datetime.fromtimestamp(self.opens[index], self.tz)
+
+    def time_to_close(self, at):
+        """Time left in the current session, or None when the market is closed."""
+        local = self._local(at)
+        index = self._session_of_day[self._day_index(local.date())]
+        if index == -1 or not (self.opens[index] <= at.timestamp() < self.closes[index]):
+            return None
+        return timedelta(seconds=self.closes[index] - at.timestamp())
+
+    def expiry_session(self, expiry_date):
+        """
+        (open, close) of the session in which an option with this expiration
+        date last trades: the expiration date itself, or the previous trading
+        day when it falls on a holiday.
+        """
+        index = self._prev_session[self._day_index(expiry_date)]
+        if index == -1:
+            return None
+        return (datetime.fromtimestamp(self.opens[index], self.tz),
+                datetime.fromtimestamp(self.closes[index], self.tz))
+
+    def is_expiry_day(self, expiry_date, at):
+        session = self.expiry_session(expiry_date)
+        return session is not None and session[0].date() == self._local(at).date()
+
+_calendar = None
+
+def get_market_calendar() -> MarketCalendar:
+    global _calendar
+    if _calendar is None:
+        _calendar = MarketCalendar()
+    return _calendar
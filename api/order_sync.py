@@ -0,0 +1,173 @@
+"""
+Incremental local mirror of broker orders.
+The first sync pages through the full order history; later syncs only
+fetch orders submitted after the stored watermark (the newest mirrored
+order). Mirrored orders that were still open are re-read on their own,
+however old they are.
+"""
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from .alpaca_client import get_alpaca_client
+from .database import get_database
+from .fill_tracker import TERMINAL_STATUSES
+from .rate_limiter import PRIORITY_BACKGROUND
+import asyncio
+import logging
+import os
+import re
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ORDER_SYNC_PAGE_SIZE = int(os.getenv("ORDER_SYNC_PAGE_SIZE", "500"))
+# Minimum seconds between two syncs of the same account
+ORDER_SYNC_MIN_INTERVAL = float(os.getenv("ORDER_SYNC_MIN_INTERVAL", "2"))
+# Most recent closed orders returned by get_closed_orders
+CLOSED_ORDERS_LIMIT = int(os.getenv("CLOSED_ORDERS_LIMIT", "1000"))
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_FRACTION = re.compile(r"\.(\d+)")
+
+_locks = {}
+_last_sync = {}
+
+def parse_timestamp(value):
+    # Broker timestamps may carry nanoseconds; datetime keeps microseconds
+    value = _FRACTION.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), value.replace("Z", "+00:00"), count=1)
+    return datetime.fromisoformat(value)
+
+def format_timestamp(value):
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+async def get_watermark(account):
+    state_collection = await get_database("orderSyncState")
+    state = await state_collection.find_one({"account": account})
+    return state["watermark"] if state else EPOCH
+
+async def update_watermark(account):
+    """
+    The next sync starts at the newest mirrored order. Open orders before
+    it are kept current by refresh_open_orders instead.
+    """
+    orders_collection = await get_database("brokerOrders")
+    newest = await orders_collection.find_one({"account": account}, sort=[("submittedAt", -1)])
+    if newest is None:
+        return EPOCH
+
+    watermark = newest["submittedAt"]
+    state_collection = await get_database("orderSyncState")
+    await state_collection.update_one(
+        {"account": account},
+        {"$set": {"watermark": watermark, "syncedAt": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    return watermark
+
+async def write_orders(orders_collection, account, orders):
+    await orders_collection.bulk_write([
+        UpdateOne(
+            {"account": account, "id": order["id"]},
+            {"$set": {**order, "account": account, "submittedAt": parse_timestamp(order["submitted_at"])}},
+            upsert=True,
+        )
+        for order in orders
+    ], ordered=False)
+
+async def refresh_open_orders(alpaca, account, orders_collection):
+    """
+    Re-read mirrored orders that were not terminal yet. One listing of the
+    broker's open orders covers most of them; the rest have closed since
+    and are fetched one by one. Returns the number of orders refreshed.
+    """
+    open_ids = set(await orders_collection.distinct(
+        "id", {"account": account, "status": {"$nin": list(TERMINAL_STATUSES)}}
+    ))
+    if not open_ids:
+        return 0
+
+    response = await alpaca.get_orders({"status": "open", "limit": ORDER_SYNC_PAGE_SIZE}, priority=PRIORITY_BACKGROUND)
+    if response.status_code != 200:
+        raise RuntimeError(f"Open order refresh for {account} failed: {response.text}")
+    orders = [order for order in response.json() if order["id"] in open_ids]
+
+    for order_id in open_ids - {order["id"] for order in orders}:
+        response = await alpaca.get_order(order_id, priority=PRIORITY_BACKGROUND)
+        if response.status_code == 200:
+            orders.append(response.json())
+        else:
+            logger.warning(f"Order {order_id} lookup returned {response.status_code}")
+
+    if orders:
+        await write_orders(orders_collection, account, orders)
+    return len(orders)
+
+async def sync_orders(account, force=False):
+    """
+    Pull every order submitted after the watermark into `brokerOrders`
+    and refresh the mirrored open orders. Returns the number of new orders.
+    """
+    lock = _locks.setdefault(account, asyncio.Lock())
+    async with lock:
+        if not force and time.monotonic() - _last_sync.get(account, 0) < ORDER_SYNC_MIN_INTERVAL:
+            return 0
+
+        alpaca = get_alpaca_client(account)
+        orders_collection = await get_database("brokerOrders")
+        # `after` is exclusive, so step back a microsecond to keep orders at the cursor
+        cursor = (await get_watermark(account)).replace(tzinfo=timezone.utc) - timedelta(microseconds=1)
+        seen = set()
+
+        while True:
+            response = await alpaca.get_orders({
+                "status": "all",
+                "direction": "asc",
+                "limit": ORDER_SYNC_PAGE_SIZE,
+                "after": format_timestamp(cursor),
+            }, priority=PRIORITY_BACKGROUND)
+            if response.status_code != 200:
+                raise RuntimeError(f"Order sync for {account} failed: {response.text}")
+
+            page = response.json()
+            new_orders = [order for order in page if order["id"] not in seen]
+            if new_orders:
+                await write_orders(orders_collection, account, new_orders)
+                seen.update(order["id"] for order in new_orders)
+
+            if len(page) < ORDER_SYNC_PAGE_SIZE:
+                break
+            last = parse_timestamp(page[-1]["submitted_at"])
+            if new_orders:
+                # Overlap by a microsecond so orders sharing the last timestamp are not lost
+                cursor = last - timedelta(microseconds=1)
+            else:
+                # A full page of one timestamp: `after` cannot page inside it, so step past it
+                logger.warning(f"More than {ORDER_SYNC_PAGE_SIZE} orders for {account} at {format_timestamp(last)}; some may be missing")
+                cursor = last + timedelta(microseconds=1)
+
+        await refresh_open_orders(alpaca, account, orders_collection)
+        await update_watermark(account)
+        _last_sync[account] = time.monotonic()
+        if seen:
+            logger.info(f"Synced {len(seen)} orders for {account}")
+        return len(seen)
+
+async def get_closed_orders(account, limit=CLOSED_ORDERS_LIMIT):
+    """
+    The `limit` most recent closed orders of an account from the local
+    mirror, newest first, in the broker's JSON shape.
+    """
+    try:
+        await sync_orders(account)
+    except Exception as e:
+        # Serve what is already mirrored if the broker is unreachable
+        logger.error(f"Error syncing orders for {account}: {str(e)}")
+
+    orders_collection = await get_database("brokerOrders")
+    return await orders_collection.find(
+        {"account": account, "status": {"$in": list(TERMINAL_STATUSES)}},
+        {"_id": 0, "account": 0, "submittedAt": 0},
+    ).sort("submittedAt", -1).limit(limit).to_list(limit)
@@ -0,0 +1,262 @@
+"""
+Live quote hub behind /ws/quotes.
+One upstream market-data stream per asset class carries the union of
+symbols that browser clients watch. Each client gets the latest quote per
+symbol, coalesced while its previous send is still in flight, and a symbol
+is unsubscribed upstream once no client watches it any more.
+"""
+from dotenv import load_dotenv
+from .alpaca_client import ACCOUNTS
+from .routes.utils import OCC_SYMBOL
+import asyncio
+import json
+import logging
+import os
+import websockets
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ALPACA_STOCK_STREAM_URL = os.getenv("ALPACA_STOCK_STREAM_URL", "wss://stream.data.alpaca.markets/v2/iex")
+ALPACA_OPTIONS_STREAM_URL = os.getenv("ALPACA_OPTIONS_STREAM_URL", "wss://stream.data.alpaca.markets/v1beta1/indicative")
+# Minimum gap between two sends to the same browser client
+QUOTE_FLUSH_INTERVAL = float(os.getenv("QUOTE_FLUSH_INTERVAL", "0.1"))
+# A client that cannot take a send within this long is disconnected
+QUOTE_SEND_TIMEOUT = float(os.getenv("QUOTE_SEND_TIMEOUT", "5"))
+QUOTE_MAX_SYMBOLS = int(os.getenv("QUOTE_MAX_SYMBOLS", "500"))
+
+def quote_from_message(item):
+    timestamp = item.get("t")
+    return {
+        "symbol": item["S"],
+        "bidPrice": item.get("bp"),
+        "bidSize": item.get("bs"),
+        "askPrice": item.get("ap"),
+        "askSize": item.get("as"),
+        "timestamp": timestamp if isinstance(timestamp, str) or timestamp is None else timestamp.isoformat(),
+    }
+
+class MarketDataStream:
+    """
+    Quote subscription on one Alpaca market-data websocket. The options
+    feed only speaks MessagePack; the stock feed uses JSON.
+    """
+    def __init__(self, key, secret, url, on_quote, use_msgpack=False):
+        self.key = key
+        self.secret = secret
+        self.url = url
+        self.on_quote = on_quote
+        self.use_msgpack = use_msgpack
+        self.symbols = set()
+        self.connected = False
+        self._websocket = None
+        self._task = None
+
+    def _encode(self, payload):
+        return msgpack.packb(payload) if self.use_msgpack else json.dumps(payload)
+
+    def _decode(self, message):
+        if self.use_msgpack:
+            return msgpack.unpackb(message, timestamp=3)
+        return json.loads(message)
+
+    async def _send(self, action, symbols):
+        if self.connected and symbols:
+            await self._websocket.send(self._encode({"action": action, "quotes": sorted(symbols)}))
+
+    async def subscribe(self, symbols):
+        added = set(symbols) - self.symbols
+        self.symbols |= added
+        self.start()
+        await self._send("subscribe", added)
+
+    async def unsubscribe(self, symbols):
+        removed = set(symbols) & self.symbols
+        self.symbols -= removed
+        if not self.symbols:
+            # Nobody is listening; drop the upstream connection entirely
+            await self.stop()
+            # A client may have subscribed while the connection was closing
+            if self.symbols:
+                self.start()
+            return
+        await self._send("unsubscribe", removed)
+
+    async def _authenticate(self, websocket):
+        self._decode(await websocket.recv())  # connected greeting
+        await websocket.send(self._encode({"action": "auth", "key": self.key, "secret": self.secret}))
+        reply = self._decode(await websocket.recv())
+        if not any(item.get("T") == "success" and item.get("msg") == "authenticated" for item in reply):
+            raise ConnectionError(f"Market data stream not authorized: {reply}")
+
+    async def run(self):
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    await self._authenticate(websocket)
+                    self._websocket = websocket
+                    # Mark connected first so symbols added meanwhile are sent on their own
+                    self.connected = True
+                    await self._send("subscribe", set(self.symbols))
+                    delay = 1
+                    logger.info(f"Connected to market data stream {self.url}")
+                    async for message in websocket:
+                        for item in self._decode(message):
+                            if item.get("T") == "q":
+                                self.on_quote(quote_from_message(item))
+                            elif item.get("T") == "error":
+                                logger.warning(f"Market data stream error: {item}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Market data stream disconnected: {str(e)}")
+            finally:
+                self.connected = False
+                self._websocket = None
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        # Detach the task before awaiting it, so a start() meanwhile creates a new one
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.connected = False
+
+class QuoteSubscriber:
+    """One browser connection. Holds at most one pending quote per symbol."""
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.symbols = set()
+        self.coalesced = 0
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def push(self, quote):
+        if quote["symbol"] in self._pending:
+            self.coalesced += 1
+        self._pending[quote["symbol"]] = quote
+        self._ready.set()
+
+    async def run_sender(self):
+        """
+        Send pending quotes in batches. While a send is in flight newer
+        quotes overwrite older ones, so a slow client gets fewer, fresher
+        updates instead of an ever-growing queue.
+        """
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                batch, self._pending = list(self._pending.values()), {}
+                await asyncio.wait_for(self.websocket.send_json({"type": "quotes", "data": batch}), QUOTE_SEND_TIMEOUT)
+                await asyncio.sleep(QUOTE_FLUSH_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Dropping slow quote client: {str(e)}")
+            try:
+                await asyncio.wait_for(self.websocket.close(code=1013), QUOTE_SEND_TIMEOUT)
+            except Exception:
+                pass
+
+class QuoteHub:
+    def __init__(self):
+        self._clients_by_symbol = {}
+        self._streams = {}
+
+    def _account_for(self, symbol):
+        return "options" if OCC_SYMBOL.match(symbol) else "stock"
+
+    def _stream(self, account):
+        stream = self._streams.get(account)
+        if stream is None:
+            if account == "options" and msgpack is None:
+                raise RuntimeError("The options quote stream needs the msgpack package")
+            key_env, secret_env = ACCOUNTS[account]
+            url = ALPACA_OPTIONS_STREAM_URL if account == "options" else ALPACA_STOCK_STREAM_URL
+            stream = MarketDataStream(os.getenv(key_env), os.getenv(secret_env), url, self.publish, account == "options")
+            self._streams[account] = stream
+        return stream
+
+    def publish(self, quote):
+        for client in self._clients_by_symbol.get(quote["symbol"], ()):
+            client.push(quote)
+
+    async def subscribe(self, client, symbols):
+        symbols = set(symbols) - client.symbols
+        if len(client.symbols) + len(symbols) > QUOTE_MAX_SYMBOLS:
+            raise ValueError(f"At most {QUOTE_MAX_SYMBOLS} symbols per connection")
+        # Resolve the upstreams before registering, so a failure leaves no partial state
+        for account in {self._account_for(symbol) for symbol in symbols}:
+            self._stream(account)
+
+        upstream = {}
+        for symbol in symbols:
+            clients = self._clients_by_symbol.setdefault(symbol, set())
+            if not clients:
+                upstream.setdefault(self._account_for(symbol), []).append(symbol)
+            clients.add(client)
+        client.symbols |= symbols
+
+        for account, new_symbols in upstream.items():
+            await self._stream(account).subscribe(new_symbols)
+
+    async def unsubscribe(self, client, symbols):
+        symbols = set(symbols) & client.symbols
+        client.symbols -= symbols
+
+        upstream = {}
+        for symbol in symbols:
+            clients = self._clients_by_symbol.get(symbol, set())
+            clients.discard(client)
+            if not clients:
+                self._clients_by_symbol.pop(symbol, None)
+                upstream.setdefault(self._account_for(symbol), []).append(symbol)
+
+        for account, old_symbols in upstream.items():
+            await self._stream(account).unsubscribe(old_symbols)
+
+    async def remove(self, client):
+        await self.unsubscribe(client, set(client.symbols))
+
+    async def stop(self):
+        for stream in self._streams.values():
+            await stream.stop()
+
+    def get_metrics(self):
+        clients = {client for clients in self._clients_by_symbol.values() for client in clients}
+        return {
+            "clients": len(clients),
+            "symbols": len(self._clients_by_symbol),
+            "coalesced": sum(client.coalesced for client in clients),
+            "streams": {
+                account: {"connected": stream.connected, "symbols": len(stream.symbols)}
+                for account, stream in self._streams.items()
+            },
+        }
+
+_hub = None
+
+def get_quote_hub() -> QuoteHub:
+    global _hub
+    if _hub is None:
+        _hub = QuoteHub()
+    return _hub
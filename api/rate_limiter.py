@@ -0,0 +1,118 @@
+"""
+Client-side token bucket with priority classes for broker calls.
+Order submission is served ahead of reads, and reads may not take the
+tokens reserved for orders.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+# Priority classes, lower is served first
+PRIORITY_ORDER = 0
+PRIORITY_READ = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_ORDER: "order",
+    PRIORITY_READ: "read",
+    PRIORITY_BACKGROUND: "background",
+}
+
+class TokenBucketLimiter:
+    def __init__(self, rate_per_minute: float, capacity: float = None, order_reserve: float = 0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.order_reserve = order_reserve
+        self.tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._drain_task = None
+        # Set when a waiter is queued, so the drain loop re-checks the head
+        self._wakeup = asyncio.Event()
+        self.metrics = {
+            "granted": {name: 0 for name in PRIORITY_NAMES.values()},
+            "waited": {name: 0 for name in PRIORITY_NAMES.values()},
+            "wait_seconds": {name: 0.0 for name in PRIORITY_NAMES.values()},
+            "throttled_429": 0,
+            "broker_remaining": None,
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        return now
+
+    def _available(self, priority):
+        reserve = 0 if priority == PRIORITY_ORDER else self.order_reserve
+        return self.tokens - reserve >= 1
+
+    def _grant(self, priority, waited_since=None):
+        name = PRIORITY_NAMES[priority]
+        self.tokens -= 1
+        self.metrics["granted"][name] += 1
+        if waited_since is not None:
+            self.metrics["waited"][name] += 1
+            self.metrics["wait_seconds"][name] += time.monotonic() - waited_since
+
+    async def acquire(self, priority=PRIORITY_READ):
+        now = self._refill()
+        # Only waiters of a lower class may be queued, e.g. reads starved by the order reserve
+        ahead = self._waiters and self._waiters[0][0] <= priority
+        if not ahead and now >= self._blocked_until and self._available(priority):
+            self._grant(priority)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), now, future))
+        self._wakeup.set()
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+        await future
+
+    async def _drain(self):
+        while self._waiters:
+            now = self._refill()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+
+            # Serve the head of the queue; a read never jumps ahead of a waiting order
+            priority, _, waited_since, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._available(priority):
+                heapq.heappop(self._waiters)
+                self._grant(priority, waited_since)
+                future.set_result(None)
+                continue
+
+            reserve = 0 if priority == PRIORITY_ORDER else self.order_reserve
+            # Wait for the refill, or until a newly queued waiter may outrank this head
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), (1 + reserve - self.tokens) / self.rate)
+            except asyncio.TimeoutError:
+                pass
+
+    def pause(self, seconds: float):
+        # Honor a 429 Retry-After: nothing is granted until it passes
+        self._refill()
+        self.tokens = 0
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self.metrics["throttled_429"] += 1
+
+    def get_metrics(self):
+        self._refill()
+        return {
+            **self.metrics,
+            "tokens": round(self.tokens, 2),
+            "capacity": self.capacity,
+            "rate_per_minute": self.rate * 60,
+            "queued": len(self._waiters),
+            "blocked_for": max(0.0, self._blocked_until - time.monotonic()),
+        }
@@ -0,0 +1,133 @@
+"""
+Retry policy and circuit breaker for broker calls.
+Order submits carry a client_order_id, so a retry after an ambiguous
+failure finds the first order instead of creating a duplicate.
+"""
+from dotenv import load_dotenv
+import asyncio
+import httpx
+import logging
+import os
+import random
+import time
+import uuid
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BROKER_RETRY_ATTEMPTS = int(os.getenv("BROKER_RETRY_ATTEMPTS", "4"))
+BROKER_RETRY_BASE_DELAY = float(os.getenv("BROKER_RETRY_BASE_DELAY", "0.2"))
+BROKER_RETRY_MAX_DELAY = float(os.getenv("BROKER_RETRY_MAX_DELAY", "3"))
+BROKER_BREAKER_THRESHOLD = int(os.getenv("BROKER_BREAKER_THRESHOLD", "5"))
+BROKER_BREAKER_RESET = float(os.getenv("BROKER_BREAKER_RESET", "30"))
+
+# Server-side failures worth retrying; 4xx means the request itself is wrong
+RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    until `reset_timeout` passes; then one trial call decides whether it
+    closes again.
+    """
+    def __init__(self, name, failure_threshold=BROKER_BREAKER_THRESHOLD, reset_timeout=BROKER_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_running):
+            raise CircuitOpenError(f"Broker circuit {self.name} is open")
+        if state == "half_open":
+            self._trial_running = True
+
+    def release_trial(self):
+        # The trial call ended without an answer from the broker; allow another
+        self._trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.error(f"Broker circuit {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+class RetryPolicy:
+    def __init__(self, max_attempts=BROKER_RETRY_ATTEMPTS, base_delay=BROKER_RETRY_BASE_DELAY,
+                 max_delay=BROKER_RETRY_MAX_DELAY, retryable_statuses=RETRYABLE_STATUSES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable_statuses = retryable_statuses
+
+    def delay(self, attempt):
+        # Capped exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def is_retryable(self, response=None, error=None):
+        if error is not None:
+            return isinstance(error, httpx.TransportError)
+        return response.status_code in self.retryable_statuses
+
+DEFAULT_ORDER_RETRY = RetryPolicy()
+
+async def submit_order_with_retry(alpaca, payload, policy=DEFAULT_ORDER_RETRY):
+    """
+    Submit an order, retrying only transport errors and 5xx responses.
+    Returns the broker response of the accepted order, or the last failed one.
+    """
+    caller_id = payload.get("client_order_id")
+    payload = {**payload, "client_order_id": caller_id or str(uuid.uuid4())}
+    client_order_id = payload["client_order_id"]
+
+    response = None
+    for attempt in range(policy.max_attempts):
+        if attempt > 0:
+            await asyncio.sleep(policy.delay(attempt - 1))
+            # The previous attempt may have reached the broker; reuse that order
+            existing = await alpaca.get_order_by_client_order_id(client_order_id)
+            if existing.status_code == 200:
+                return existing
+
+        try:
+            response = await alpaca.submit_order(payload)
+        except Exception as e:
+            if not policy.is_retryable(error=e) or attempt + 1 == policy.max_attempts:
+                raise
+            logger.warning(f"Order {client_order_id} attempt {attempt + 1} failed: {str(e)}")
+            continue
+
+        if response.status_code == 200:
+            return response
+        if not policy.is_retryable(response=response):
+            if caller_id:
+                # A caller-chosen id may already be taken by an earlier run of the same order
+                existing = await alpaca.get_order_by_client_order_id(client_order_id)
+                if existing.status_code == 200:
+                    return existing
+            return response
+        logger.warning(f"Order {client_order_id} attempt {attempt + 1} returned {response.status_code}")
+
+    return response
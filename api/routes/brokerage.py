@@ -2,13 +2,23 @@ from fastapi import APIRouter, HTTPException, Request, Header, Depends
 from ..models.trader import TraderCreate, Trader
 from bson import ObjectId
 from passlib.context import CryptContext # type: ignore
-from pydantic import BaseModel
+from pydantic import BaseModel, confloat, conint
 from typing import Optional
 from  ..database import get_database
 from ..models.brokerage import BrokerageCreate, Brokerage
 import os
-import requests
+from ..alpaca_client import get_alpaca_client
+from ..ttl_cache import TTLCache
+from ..greeks import SECONDS_PER_YEAR, chain_greeks
+from ..market_calendar import get_market_calendar
+from ..wire_format import Layout, render, shape_rows
+from .. import clock
+from datetime import date as Date, datetime, time, timedelta
+import numpy as np
 from dotenv import load_dotenv
+from bisect import bisect_left, bisect_right
+import asyncio
+import math
 import logging
 
 load_dotenv()
@@ -16,6 +26,20 @@ load_dotenv()
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Contract metadata changes at most daily; quotes and snapshots only need to be seconds fresh
+OPTIONS_SNAPSHOT_TTL = float(os.getenv("OPTIONS_SNAPSHOT_TTL", "3"))
+OPTIONS_SNAPSHOT_STALE_TTL = float(os.getenv("OPTIONS_SNAPSHOT_STALE_TTL", "30"))
+
+contract_cache = TTLCache(24 * 60 * 60)
+snapshot_cache = TTLCache(OPTIONS_SNAPSHOT_TTL, stale_ttl=OPTIONS_SNAPSHOT_STALE_TTL)
+quote_cache = TTLCache(OPTIONS_SNAPSHOT_TTL, stale_ttl=OPTIONS_SNAPSHOT_STALE_TTL)
+
+def seconds_until_end_of_day():
+    # Contract metadata is held until midnight ET
+    now = clock.now()
+    end_of_day = datetime.combine(now.date() + timedelta(days=1), time.min, now.tzinfo)
+    return max(1.0, (end_of_day - now).total_seconds())
+
 # Add this near the top with other initializations
 
 @router.get("/getBrokerages")
@@ -72,49 +96,232 @@ class GetOptionsChainRequest(BaseModel):
     symbol: str
     optionType: str
     date: str
+    # Optional filters; the strike window is centred on current_price
+    strikeWindow: Optional[conint(ge=0)] = None  # N strikes either side
+    strikePercent: Optional[confloat(ge=0)] = None  # strikes within X% of the price
+    minOpenInterest: Optional[int] = None
+    minVolume: Optional[int] = None
+    minDelta: Optional[float] = None  # compared against abs(delta)
+    maxDelta: Optional[float] = None
+
+def index_contracts_by_strike(contract_data):
+    # Sorted once when the contracts are cached, so windows are a binary search
+    contracts = sorted(contract_data['option_contracts'], key=lambda contract: float(contract['strike_price']))
+    return {
+        'option_contracts': contracts,
+        'strikes': [float(contract['strike_price']) for contract in contracts],
+    }
+
+def select_contracts(contract_data, current_price, request):
+    """Contracts inside the requested strike window with enough open interest."""
+    contracts = contract_data['option_contracts']
+    strikes = contract_data['strikes']
+    lo, hi = 0, len(strikes)
+
+    if current_price:
+        if request.strikePercent is not None:
+            lo = max(lo, bisect_left(strikes, current_price * (1 - request.strikePercent / 100)))
+            hi = min(hi, bisect_right(strikes, current_price * (1 + request.strikePercent / 100)))
+        if request.strikeWindow is not None:
+            at_the_money = bisect_left(strikes, current_price)
+            lo = max(lo, at_the_money - request.strikeWindow)
+            hi = min(hi, at_the_money + request.strikeWindow)
+
+    selected = contracts[lo:hi]
+    if request.minOpenInterest:
+        selected = [
+            contract for contract in selected
+            if float(contract.get('open_interest') or 0) >= request.minOpenInterest
+        ]
+    return selected
+
+def filter_merged(merged_array, request):
+    # Volume and delta are only known once snapshots are merged and greeks filled
+    def keep(row):
+        if request.minVolume and (row['volume'] or 0) < request.minVolume:
+            return False
+        if request.minDelta is None and request.maxDelta is None:
+            return True
+        if row['delta'] is None:
+            return False
+        delta = abs(row['delta'])
+        if request.minDelta is not None and delta < request.minDelta:
+            return False
+        return request.maxDelta is None or delta <= request.maxDelta
+    return [row for row in merged_array if keep(row)]
 
 def merge_options_data(options_data, contract_data):
     """
     Merge options snapshots with contract data.
+    Walks the (possibly pre-filtered) contracts and looks each snapshot up
+    by symbol, so the merge is linear in the contracts kept.
     """
     merged_array = []
 
     # Check if both data structures exist
-    if options_data and contract_data:
-        if 'snapshots' in options_data and 'option_contracts' in contract_data:
-            for key, snapshot in options_data['snapshots'].items():
-                # Find matching contract
-                matching_contract = None
-                for contract in contract_data['option_contracts']:
-                    if contract['symbol'] == key:
-                        matching_contract = contract
-                        break
-
-                if matching_contract:
-                    # Create merged data
-                    latest_quote = snapshot.get('latestQuote', {})
-                    greeks = snapshot.get('greeks', {})
-                    greek = snapshot.get('greek', {})
-                    
-                    merged_data = {
-                        'symbol': key,
-                        'bidPrice': latest_quote.get('bp'),
-                        'askPrice': latest_quote.get('ap'),
-                        'lastPrice': greek.get('last_price'),
-                        'volume': latest_quote.get('volume'),
-                        'delta': greeks.get('delta'),
-                        'gamma': greeks.get('gamma'),
-                        'theta': greeks.get('theta'),
-                        'vega': greeks.get('vega')
-                    }
-                    # Add contract data
-                    merged_data.update(matching_contract)
-                    merged_array.append(merged_data)
+    if not options_data or not contract_data:
+        return merged_array
+    snapshots = options_data.get('snapshots')
+    contracts = contract_data.get('option_contracts')
+    if not snapshots or not contracts:
+        return merged_array
+
+    seen = set()
+    for matching_contract in contracts:
+        key = matching_contract['symbol']
+        snapshot = snapshots.get(key)
+        # The first contract wins when a symbol repeats
+        if snapshot is None or key in seen:
+            continue
+        seen.add(key)
+
+        latest_quote = snapshot.get('latestQuote') or {}
+        latest_trade = snapshot.get('latestTrade') or {}
+        daily_bar = snapshot.get('dailyBar') or {}
+        greeks = snapshot.get('greeks') or {}
+
+        merged_array.append({
+            'symbol': key,
+            'bidPrice': latest_quote.get('bp'),
+            'askPrice': latest_quote.get('ap'),
+            'lastPrice': latest_trade.get('p'),
+            'impliedVolatility': snapshot.get('impliedVolatility'),
+            'volume': daily_bar.get('v'),
+            'delta': greeks.get('delta'),
+            'gamma': greeks.get('gamma'),
+            'theta': greeks.get('theta'),
+            'vega': greeks.get('vega'),
+            # Add contract data
+            **matching_contract,
+        })
 
     return merged_array
 
+def expiry_close_timestamp(expiration_date):
+    # Options stop trading at the close of their expiry session
+    expiry = Date.fromisoformat(expiration_date)
+    try:
+        session = get_market_calendar().expiry_session(expiry)
+    except ValueError:
+        session = None
+    if session is None:
+        return datetime.combine(expiry, time(16), clock.EASTERN).timestamp()
+    return session[1].timestamp()
+
+def apply_local_greeks(merged_array, current_price):
+    """
+    Solve IV and greeks for the whole chain from the bid/ask mid and the
+    underlying mid. Fields the feed left empty are filled with local values.
+    """
+    if not merged_array or not current_price:
+        return merged_array
+
+    now = clock.timestamp()
+    closes = {}
+    years = []
+    for row in merged_array:
+        expiration = row['expiration_date']
+        if expiration not in closes:
+            closes[expiration] = expiry_close_timestamp(expiration)
+        years.append((closes[expiration] - now) / SECONDS_PER_YEAR)
+
+    local = chain_greeks(
+        current_price,
+        [float(row['strike_price']) for row in merged_array],
+        years,
+        [row['type'] == 'call' for row in merged_array],
+        [row['bidPrice'] if row['bidPrice'] is not None else np.nan for row in merged_array],
+        [row['askPrice'] if row['askPrice'] is not None else np.nan for row in merged_array],
+    )
+
+    fields = {'impliedVolatility': 'iv', 'delta': 'delta', 'gamma': 'gamma', 'theta': 'theta', 'vega': 'vega'}
+    values = {field: local[name].tolist() for field, name in fields.items()}
+    for i, row in enumerate(merged_array):
+        for field in fields:
+            value = values[field][i]
+            if row[field] is None and not math.isnan(value):
+                row[field] = value
+    return merged_array
+
+async def fetch_all_pages(fetch, params, items_key):
+    """
+    Follow next_page_token until the last page and merge the items.
+    Snapshot pages hold a dict of items, contract pages a list.
+    """
+    merged = None
+    page_token = None
+    while True:
+        page_params = {**params, "page_token": page_token} if page_token else params
+        response = await fetch(page_params)
+        if response.status_code != 200:
+            raise RuntimeError(f"{items_key} request failed ({response.status_code}): {response.text}")
+
+        data = response.json()
+        items = data.get(items_key) or {}
+        if merged is None:
+            merged = items
+        elif isinstance(merged, dict):
+            merged.update(items)
+        else:
+            merged.extend(items)
+
+        page_token = data.get("next_page_token")
+        if not page_token:
+            return {items_key: merged}
+
+async def fetch_contracts(alpaca, contract_params):
+    return index_contracts_by_strike(
+        await fetch_all_pages(alpaca.get_option_contracts, contract_params, "option_contracts")
+    )
+
+async def fetch_options_chain(symbol, option_type, date):
+    """
+    Fetch snapshots, contracts and the underlying quote concurrently,
+    each paginated to completion. Returns the data and per-upstream errors.
+    """
+    alpaca = get_alpaca_client("options")
+
+    # Define query parameters
+    chain_params = {"feed": "indicative", "limit": 1000, "type": option_type, "expiration_date": date}
+    contract_params = {"underlying_symbols": symbol, "status": "active", "expiration_date": date, "type": option_type, "limit": 10000}
+
+    async def load_quote():
+        response = await alpaca.get_latest_stock_quote(symbol)
+        if response.status_code != 200:
+            raise RuntimeError(f"quote request failed ({response.status_code}): {response.text}")
+        quote_data = response.json()
+        return (quote_data['quote']['ap'] + quote_data['quote']['bp']) / 2
+
+    key = (symbol, option_type, date)
+    # Page tokens chain within each upstream, so the three upstreams run side by side
+    options_data, contract_data, current_price = await asyncio.gather(
+        snapshot_cache.get_or_load(
+            key, lambda: fetch_all_pages(lambda params: alpaca.get_option_snapshots(symbol, params), chain_params, "snapshots")
+        ),
+        contract_cache.get_or_load(
+            key, lambda: fetch_contracts(alpaca, contract_params),
+            ttl=seconds_until_end_of_day(),
+        ),
+        quote_cache.get_or_load(symbol, load_quote),
+        return_exceptions=True,
+    )
+
+    errors = {}
+    if isinstance(options_data, Exception):
+        errors["snapshots"] = str(options_data)
+        options_data = None
+    if isinstance(contract_data, Exception):
+        errors["contracts"] = str(contract_data)
+        contract_data = None
+
+    if isinstance(current_price, Exception):
+        errors["quote"] = str(current_price)
+        current_price = None
+
+    return options_data, contract_data, current_price, errors
+
 @router.post("/getOptionsChain")
-async def get_options_chain(request: GetOptionsChainRequest):
+async def get_options_chain(request: GetOptionsChainRequest, http_request: Request, layout: Layout = "rows", fields: Optional[str] = None):
     try:
         print("request",request)
         # Validate inputs
@@ -125,49 +332,47 @@ async def get_options_chain(request: GetOptionsChainRequest):
         if not request.optionType:
             raise HTTPException(status_code=400, detail="Please enter an option type")
 
-        # Get API credentials
-        api_key = os.getenv("ALPACA_OPTIONS_API_KEY")
-        api_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
-
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": api_key ,
-            "APCA-API-SECRET-KEY": api_secret
-        }
-
-        print("headers",headers)
-        # Define URLs
-        chain_url = f"https://data.alpaca.markets/v1beta1/options/snapshots/{request.symbol}?feed=indicative&limit=1000&type={request.optionType}&expiration_date={request.date}"
-        contract_url = f"https://paper-api.alpaca.markets/v2/options/contracts?underlying_symbols={request.symbol}&status=active&expiration_date={request.date}&type={request.optionType}&limit=10000"
-        quote_url = f"https://data.alpaca.markets/v2/stocks/{request.symbol}/quotes/latest"
-
         # Fetch data
-        options_response = requests.get(chain_url, headers=headers)
-        options_data = options_response.json()
-        logger.info(f"Fetched options data for {options_data}")
+        options_data, contract_data, current_price, errors = await fetch_options_chain(
+            request.symbol, request.optionType, request.date
+        )
+        # The chain is unusable without both snapshots and contracts
+        if "snapshots" in errors or "contracts" in errors:
+            logger.error(f"Options chain upstream failure for {request.symbol}: {errors}")
+            raise HTTPException(status_code=502, detail=errors)
+        # Without the underlying price the strike window cannot be placed; do not return the full chain instead
+        if not current_price and (request.strikeWindow is not None or request.strikePercent is not None):
+            logger.error(f"Options chain strike filter for {request.symbol} needs the underlying quote: {errors}")
+            raise HTTPException(status_code=502, detail={**errors, "strikeWindow": "Underlying price unavailable"})
 
-        contract_response = requests.get(contract_url, headers=headers)
-        contract_data = contract_response.json()
-        logger.info(f"Fetched contract data for {contract_data}")
-
-        quote_response = requests.get(quote_url, headers=headers)
-        quote_data = quote_response.json()
-        current_price = (quote_data['quote']['ap'] + quote_data['quote']['bp']) / 2
+        logger.info(f"Fetched {len(options_data['snapshots'])} snapshots and {len(contract_data['option_contracts'])} contracts for {request.symbol}")
         logger.info(f"Current price for {request.symbol}: {current_price}")
 
-        # Merge the data
-        merged_data = merge_options_data(options_data, contract_data)
+        # Narrow the contracts first so only the kept strikes are merged and priced
+        selected = {"option_contracts": select_contracts(contract_data, current_price, request)}
+        merged_data = apply_local_greeks(merge_options_data(options_data, selected), current_price)
+        merged_data = filter_merged(merged_data, request)
         
-        return {
-            "options_data": {"snapshots": merged_data},
-            "current_price": current_price
-        }
+        return render(http_request, {
+            "options_data": {"snapshots": shape_rows(merged_data, layout, fields)},
+            "current_price": current_price,
+            "errors": errors
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching options data: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/optionsChainCache")
+async def get_options_chain_cache_metrics():
+    return {
+        "contracts": contract_cache.get_metrics(),
+        "snapshots": snapshot_cache.get_metrics(),
+        "quotes": quote_cache.get_metrics(),
+    }
+
 class BuyOptionsRequest(BaseModel):
     symbol: str
     amount: str
@@ -175,16 +380,7 @@ class BuyOptionsRequest(BaseModel):
 @router.post("/buyOptions")
 async def buy_options(request: BuyOptionsRequest):
     try:
-        api_key = os.getenv("ALPACA_OPTIONS_API_KEY")
-        api_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "APCA-API-KEY-ID": api_key ,
-            "APCA-API-SECRET-KEY": api_secret
-        }
-
-        url = f"https://paper-api.alpaca.markets/v2/orders"
+        alpaca = get_alpaca_client("options")
 
         buy_payload = {
             "type": "market",
@@ -194,7 +390,7 @@ async def buy_options(request: BuyOptionsRequest):
             "side": "buy"
         }
 
-        response = requests.post(url, headers=headers, json=buy_payload)
+        response = await alpaca.submit_order(buy_payload)
         print("response",response.json())
         return response.json()
         
@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
 from ..database import get_database
 from bson import ObjectId
 from pydantic import BaseModel
 from ..models.brokerage import Brokerage
-import os
-import requests
+from ..alpaca_client import get_alpaca_client
+from ..order_sync import get_closed_orders
+from ..wire_format import Layout, render, shape_rows
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -66,30 +68,17 @@ async def update_brokerage(brokerage: UpdateBrokerage):
 # using another api key and secret key for options trading |  stock trading is using another api key and secret key
 
 @router.get("/closedpositions")
-async def get_open_positions():
+async def get_open_positions(request: Request, layout: Layout = "rows", fields: Optional[str] = None):
     try:
         # print("openpositions")
         
-        CHUNK_SIZE = 1000
-        alpaca_api= os.getenv("ALPACA_OPTIONS_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
-        url = "https://paper-api.alpaca.markets/v2/orders?status=closed&limit=" + str(CHUNK_SIZE)
-        headers = {
-        "accept": "application/json",
-        "APCA-API-KEY-ID": alpaca_api,
-        "APCA-API-SECRET-KEY": alpaca_secret
-        }
+        alpaca = get_alpaca_client("options")
 
-
-
-        response = requests.get(url, headers=headers)
-        
-        orders = response.json()
-        url = "https://paper-api.alpaca.markets/v2/account/portfolio/history?intraday_reporting=market_hours&pnl_reset=per_day"
-        response = requests.get(url, headers=headers)
+        orders = await get_closed_orders("options")
+        response = await alpaca.get_portfolio_history({"intraday_reporting": "market_hours", "pnl_reset": "per_day"})
         portfolio_history = response.json()
         # print("orders", orders)
-        return {"orders": orders, "portfolio_history": portfolio_history}
+        return render(request, {"orders": shape_rows(orders, layout, fields), "portfolio_history": portfolio_history})
     except Exception as e:
         print(f"Error fetching open positions: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch open positions")
@@ -100,32 +89,14 @@ async def get_open_positions():
         # print("openpositions")
         
         CHUNK_SIZE = 1000
-        alpaca_api= os.getenv("ALPACA_OPTIONS_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
-        # url = "https://paper-api.alpaca.markets/v2/orders?status=closed&limit=" + str(CHUNK_SIZE)
         
-        url = "https://paper-api.alpaca.markets/v2/positions"
-        headers = {
-        "accept": "application/json",
-        "APCA-API-KEY-ID": alpaca_api,
-        "APCA-API-SECRET-KEY": alpaca_secret
-        }
-
-        response = requests.get(url, headers=headers)
+        response = await get_alpaca_client("options").get_positions()
         options_open_positions = response.json()
         # print(response.json())
         # response = trading_client.get_orders()
         orders = response.json()
 
-        alpaca_api= os.getenv("ALPACA_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-        headers = {
-        "accept": "application/json",
-        "APCA-API-KEY-ID": alpaca_api,
-        "APCA-API-SECRET-KEY": alpaca_secret
-        }
-        url = "https://paper-api.alpaca.markets/v2/positions"
-        response = requests.get(url, headers=headers)
+        response = await get_alpaca_client("stock").get_positions()
         stock_open_positions = response.json()
 
         # print("stock orders", response.json())
@@ -151,8 +122,7 @@ async def sell_options_order(order: SellOptionsOrder):
     try:
         print("sellOptionsOrder")
         # print(order)
-        alpaca_api= os.getenv("ALPACA_OPTIONS_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_OPTIONS_SECRET_KEY")
+        alpaca = get_alpaca_client("options")
         buy_sell_side = "sell"
         if order.side == "short":
             buy_sell_side = "buy"
@@ -168,15 +138,8 @@ async def sell_options_order(order: SellOptionsOrder):
         }
         
         # print("payload" , payload)
-        headers = {
-                    "accept": "application/json",
-                    "content-type": "application/json",
-                    "APCA-API-KEY-ID": alpaca_api ,
-                    "APCA-API-SECRET-KEY": alpaca_secret
-                }
-        url = "https://paper-api.alpaca.markets/v2/orders"
-
-        response = requests.post(url, json=payload, headers=headers)
+
+        response = await alpaca.submit_order(payload)
         print(response.status_code)
         # print(response.json())
 
@@ -195,8 +158,7 @@ async def close_stock_order(order: CloseStockOrder):
     try:
         print("sellOptionsOrder")
         # print(order)
-        alpaca_api= os.getenv("ALPACA_API_KEY")
-        alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
+        alpaca = get_alpaca_client("stock")
 
         buy_sell_side = "sell"
         if order.side == "short":
@@ -213,15 +175,8 @@ async def close_stock_order(order: CloseStockOrder):
         }
         
         print("payload" , payload)
-        headers = {
-                    "accept": "application/json",
-                    "content-type": "application/json",
-                    "APCA-API-KEY-ID": alpaca_api ,
-                    "APCA-API-SECRET-KEY": alpaca_secret
-                }
-        url = "https://paper-api.alpaca.markets/v2/orders"
-
-        response = requests.post(url, json=payload, headers=headers)
+
+        response = await alpaca.submit_order(payload)
         print(response.status_code)
         # print(response.json())
 
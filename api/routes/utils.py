@@ -1,40 +1,32 @@
-from datetime import datetime, timezone
-from zoneinfo import ZoneInfo
+from datetime import date
+from functools import lru_cache
+from typing import NamedTuple
+import re
 
-def parse_option_date(symbol):
-    # Find where the date part starts (first digit after letters)
-    date_start = 0
-    for i, char in enumerate(symbol):
-        if char.isdigit():
-            date_start = i
-            break
-    
-    # Extract the date portion (always 6 digits: YYMMDD)
-    date_portion = symbol[date_start:date_start+6]
-    
-    # Get month and date
-    month = date_portion[2:4]  # 3rd and 4th characters
-    date = date_portion[4:6]   # 5th and 6th characters
-    
-    return month, date
+# OCC option symbol: root, YYMMDD expiry, C/P, strike * 1000 in 8 digits
+OCC_SYMBOL = re.compile(r"^(?P<root>[A-Z0-9.]{1,6}?)\s*(?P<expiry>\d{6})(?P<type>[CP])(?P<strike>\d{8})$")
+OCC_CACHE_SIZE = 8192
+
+class OptionSymbol(NamedTuple):
+    root: str
+    expiry: date
+    option_type: str  # "call" or "put"
+    strike: float
+
+@lru_cache(maxsize=OCC_CACHE_SIZE)
+def parse_option_symbol(symbol):
+    match = OCC_SYMBOL.match(symbol)
+    if match is None:
+        raise ValueError(f"Not an OCC option symbol: {symbol}")
 
-def check_option_expiry(month, date):
-    # Get current date in ET
-    current_et = datetime.now(ZoneInfo("America/New_York"))
-    current_month = int(current_et.strftime("%m"))
-    current_date = int(current_et.strftime("%d"))
-    
-    # Convert input month and date to integers
-    option_month = int(month)
-    option_date = int(date)
-    
-    # Compare dates
-    if current_month > option_month:
-        return False
-    elif current_month < option_month:
-        return True
-    else:  # Same month
-        if current_date > option_date:
-            return False
-        else:
-            return True
+    expiry = match.group("expiry")
+    return OptionSymbol(
+        root=match.group("root"),
+        expiry=date(2000 + int(expiry[0:2]), int(expiry[2:4]), int(expiry[4:6])),
+        option_type="call" if match.group("type") == "C" else "put",
+        strike=int(match.group("strike")) / 1000,
+    )
+
+def parse_option_date(symbol):
+    # Full expiration date, including the year
+    return parse_option_symbol(symbol).expiry
@@ -0,0 +1,115 @@
+"""
+In-process snapshot of the single-document `settings` and `startStopSettings`
+collections, so the signal handlers do not read Mongo on every request.
+"""
+from .database import get_database, connect_to_mongo
+from dotenv import load_dotenv
+import asyncio
+import logging
+import os
+import time
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Max age of the snapshot when no change stream is running
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "30"))
+
+_snapshot = {
+    "version": 0,
+    "settings": None,
+    "startStopSettings": None,
+    "loaded_at": 0.0,
+}
+_refresh_lock = asyncio.Lock()
+_watch_task = None
+_change_stream_active = False
+
+async def refresh_settings(stale_version=None):
+    """
+    Reload both documents and publish them as a new snapshot version.
+    Called after every local write and by the background watcher. With
+    `stale_version`, a snapshot already replaced while waiting for the
+    lock is returned as is, so expired readers share one reload.
+    """
+    global _snapshot
+    async with _refresh_lock:
+        if stale_version is not None and _snapshot["version"] != stale_version:
+            return _snapshot
+        settings_collection = await get_database("settings")
+        start_stop_collection = await get_database("startStopSettings")
+        settings, start_stop_settings = await asyncio.gather(
+            settings_collection.find_one({}),
+            start_stop_collection.find_one({}),
+        )
+        _snapshot = {
+            "version": _snapshot["version"] + 1,
+            "settings": settings,
+            "startStopSettings": start_stop_settings,
+            "loaded_at": time.monotonic(),
+        }
+    return _snapshot
+
+async def get_settings_snapshot():
+    snapshot = _snapshot
+    expired = time.monotonic() - snapshot["loaded_at"] > SETTINGS_CACHE_TTL
+    if snapshot["version"] == 0 or (expired and not _change_stream_active):
+        snapshot = await refresh_settings(snapshot["version"])
+    return snapshot
+
+def _copy(document):
+    # The documents are flat; a shallow copy keeps callers from editing the shared snapshot
+    return dict(document) if document is not None else None
+
+async def get_cached_settings():
+    snapshot = await get_settings_snapshot()
+    return _copy(snapshot["settings"])
+
+async def get_cached_start_stop_settings():
+    snapshot = await get_settings_snapshot()
+    return _copy(snapshot["startStopSettings"])
+
+async def _watch_settings():
+    global _change_stream_active
+    pipeline = [{"$match": {"ns.coll": {"$in": ["settings", "startStopSettings"]}}}]
+    warned = False
+    while True:
+        try:
+            db = await connect_to_mongo()
+            async with db.watch(pipeline) as stream:
+                _change_stream_active = True
+                # Pick up anything written while the stream was down
+                await refresh_settings()
+                async for _ in stream:
+                    await refresh_settings()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _change_stream_active = False
+            if not warned:
+                logger.warning(f"Settings change stream unavailable, polling every {SETTINGS_CACHE_TTL}s: {str(e)}")
+                warned = True
+
+        await asyncio.sleep(SETTINGS_CACHE_TTL)
+        try:
+            await refresh_settings()
+        except Exception as e:
+            logger.error(f"Error refreshing settings: {str(e)}")
+
+def start_settings_watcher():
+    global _watch_task
+    if _watch_task is None:
+        _watch_task = asyncio.create_task(_watch_settings())
+    return _watch_task
+
+async def stop_settings_watcher():
+    global _watch_task, _change_stream_active
+    if _watch_task is not None:
+        _watch_task.cancel()
+        try:
+            await _watch_task
+        except asyncio.CancelledError:
+            pass
+    _watch_task = None
+    _change_stream_active = False
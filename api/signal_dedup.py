@@ -0,0 +1,89 @@
+"""
+Idempotency for incoming trading signals.
+A signal is fingerprinted from its explicit id or its payload, and the
+first signal with a fingerprint claims it for SIGNAL_DEDUP_TTL seconds.
+The signal queue releases a payload claim once its signal finishes, so
+only retries of a pending signal are dropped, not a later identical trade.
+Claims live in an in-process map (fast path) and in the
+signalFingerprints collection, whose _id is the fingerprint and whose
+expiresAt TTL index removes old claims, so retries hitting another
+instance are caught as well.
+"""
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError
+from .database import get_database
+from . import clock
+import hashlib
+import json
+import os
+
+load_dotenv()
+
+SIGNAL_DEDUP_TTL = float(os.getenv("SIGNAL_DEDUP_TTL", "120"))
+# In-process claims kept before expired ones are pruned
+LOCAL_CLAIMS_LIMIT = 10000
+
+# fingerprint -> (signal id, expiry timestamp)
+_claims = {}
+
+def fingerprint(kind, payload, explicit_id=None):
+    if explicit_id:
+        return f"{kind}:id:{explicit_id}"
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{kind}:sha256:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+def _remember(key, signal_id, expires):
+    _claims[key] = (signal_id, expires)
+    if len(_claims) > LOCAL_CLAIMS_LIMIT:
+        now = clock.timestamp()
+        for stale in [claim for claim, (_, until) in _claims.items() if until <= now]:
+            del _claims[stale]
+
+async def claim(key, signal_id):
+    """
+    Claim a fingerprint for `signal_id`. Returns None when the claim is new,
+    or the id of the signal that already holds it.
+    """
+    now = clock.timestamp()
+    local = _claims.get(key)
+    if local is not None and local[1] > now:
+        return local[0]
+
+    expires = now + SIGNAL_DEDUP_TTL
+    claims_collection = await get_database("signalFingerprints")
+    try:
+        await claims_collection.insert_one({
+            "_id": key,
+            "signalId": signal_id,
+            "expiresAt": datetime.fromtimestamp(expires, timezone.utc),
+        })
+        _remember(key, signal_id, expires)
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # The TTL monitor only runs once a minute, so an expired claim may still exist
+    current = datetime.fromtimestamp(now, timezone.utc)
+    taken_over = await claims_collection.update_one(
+        {"_id": key, "expiresAt": {"$lte": current}},
+        {"$set": {"signalId": signal_id, "expiresAt": datetime.fromtimestamp(expires, timezone.utc)}},
+    )
+    if taken_over.modified_count:
+        _remember(key, signal_id, expires)
+        return None
+
+    existing = await claims_collection.find_one({"_id": key})
+    if existing is None:
+        # Removed between the insert and the lookup; claim it again
+        return await claim(key, signal_id)
+    existing_expires = existing["expiresAt"].replace(tzinfo=timezone.utc).timestamp()
+    _remember(key, existing["signalId"], existing_expires)
+    return existing["signalId"]
+
+async def release(key, signal_id):
+    # Give up a claim so the next signal with this fingerprint is accepted
+    if _claims.get(key, (None,))[0] == signal_id:
+        del _claims[key]
+    claims_collection = await get_database("signalFingerprints")
+    await claims_collection.delete_one({"_id": key, "signalId": signal_id})
@@ -0,0 +1,239 @@
+"""
+Durable ingestion queue for trading signals.
+Webhook endpoints persist each signal to the signalQueue collection and
+return at once; a pool of workers processes it in the background.
+Signals are partitioned by ordering key, so signals with the same key run
+strictly in arrival order while different keys run concurrently.
+Signals still queued at shutdown are picked up again on the next start.
+A signal that was mid-order is marked "interrupted" rather than rerun,
+and signals older than SIGNAL_MAX_AGE are dropped as "expired".
+"""
+from bson import ObjectId
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from .database import get_database
+from .signal_dedup import claim, fingerprint, release
+from . import clock
+import asyncio
+import logging
+import os
+import zlib
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_WORKERS = int(os.getenv("SIGNAL_WORKERS", "8"))
+# Seconds after which a signal that has not started yet is dropped
+SIGNAL_MAX_AGE = float(os.getenv("SIGNAL_MAX_AGE", "300"))
+# Recent samples kept per latency stage
+LATENCY_SAMPLES = 500
+
+_handlers = {}
+_partitions = []
+_workers = []
+_counts = {"enqueued": 0, "duplicates": 0, "recovered": 0, "interrupted": 0, "expired": 0, "done": 0, "failed": 0}
+_latencies = {stage: deque(maxlen=LATENCY_SAMPLES) for stage in ("queued", "processing", "total")}
+
+# Id of the signal being processed, so its orders get stable client_order_ids
+current_signal_id = ContextVar("current_signal_id", default=None)
+
+def signal_order_id(leg):
+    """client_order_id for one order of the running signal, or None outside a signal."""
+    signal_id = current_signal_id.get()
+    return f"sig-{signal_id}-{leg}" if signal_id else None
+
+def register_handler(kind, handler):
+    """Register the coroutine that processes signals of `kind`; it receives the payload dict."""
+    _handlers[kind] = handler
+
+def _partition(key):
+    # crc32 is stable across processes, unlike hash() on str
+    return _partitions[zlib.crc32(key.encode()) % len(_partitions)]
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+async def enqueue_signal(kind, key, payload, explicit_id=None):
+    """
+    Persist a signal and hand it to the worker that owns `key`.
+    Returns (signal id, state): "queued", "processed" when no workers are
+    running and the signal was handled inline, or "duplicate" with the
+    original signal's id for a repeat within the dedup window.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for {kind} signals")
+
+    signal_id = ObjectId()
+    dedup_key = fingerprint(kind, payload, explicit_id)
+    # An explicit id is held for the dedup window; a payload fingerprint only
+    # until the signal finishes, so a later identical trade is not dropped
+    release_key = None if explicit_id else dedup_key
+    original_id = await claim(dedup_key, signal_id)
+    if original_id is not None:
+        _counts["duplicates"] += 1
+        return str(original_id), "duplicate"
+
+    received = clock.timestamp()
+    queue_collection = await get_database("signalQueue")
+    try:
+        inserted = await queue_collection.insert_one({
+            "_id": signal_id,
+            "kind": kind,
+            "key": key,
+            "payload": payload,
+            "status": "queued",
+            "receivedAt": _utc(received),
+            "releaseKey": release_key,
+        })
+    except Exception:
+        await release(dedup_key, signal_id)
+        raise
+    _counts["enqueued"] += 1
+    item = {
+        "_id": inserted.inserted_id, "kind": kind, "key": key, "payload": payload,
+        "received": received, "releaseKey": release_key,
+    }
+    if not _workers:
+        # Workers only exist when the app lifespan ran (not e.g. in a
+        # serverless handler); process in this request rather than drop it
+        await _process(item)
+        return str(inserted.inserted_id), "processed"
+    _partition(key).put_nowait(item)
+    return str(inserted.inserted_id), "queued"
+
+async def _update(signal_id, fields):
+    # A failed bookkeeping write must not stop the worker
+    try:
+        queue_collection = await get_database("signalQueue")
+        await queue_collection.update_one({"_id": signal_id}, {"$set": fields})
+        return True
+    except Exception as e:
+        logger.error(f"Error updating signal {signal_id}: {str(e)}")
+        return False
+
+async def _release_claim(item):
+    if not item.get("releaseKey"):
+        return
+    try:
+        await release(item["releaseKey"], item["_id"])
+    except Exception as e:
+        logger.error(f"Error releasing dedup claim of signal {item['_id']}: {str(e)}")
+
+async def _process(item):
+    try:
+        await _run(item)
+    finally:
+        await _release_claim(item)
+
+async def _run(item):
+    started = clock.timestamp()
+    _latencies["queued"].append(started - item["received"])
+    if started - item["received"] > SIGNAL_MAX_AGE:
+        # A stale signal no longer reflects the market it was sent for
+        logger.warning(f"Signal {item['_id']} ({item['kind']} {item['key']}) expired before it ran")
+        _counts["expired"] += 1
+        await _update(item["_id"], {"status": "expired", "finishedAt": _utc(started)})
+        return
+    await _update(item["_id"], {"status": "processing", "startedAt": _utc(started)})
+
+    token = current_signal_id.set(str(item["_id"]))
+    try:
+        result = await _handlers[item["kind"]](item["payload"])
+        fields = {"status": "done", "result": result}
+        _counts["done"] += 1
+    except Exception as e:
+        error = getattr(e, "detail", None) or str(e)
+        logger.error(f"Signal {item['_id']} ({item['kind']} {item['key']}) failed: {error}")
+        fields = {"status": "failed", "error": str(error)}
+        _counts["failed"] += 1
+    finally:
+        current_signal_id.reset(token)
+
+    finished = clock.timestamp()
+    _latencies["processing"].append(finished - started)
+    _latencies["total"].append(finished - item["received"])
+    fields["finishedAt"] = _utc(finished)
+    if not await _update(item["_id"], fields) and "result" in fields:
+        # A result Mongo cannot encode must not leave the signal pending and re-run on restart
+        await _update(item["_id"], {**fields, "result": str(fields["result"])})
+
+async def _worker(queue):
+    while True:
+        item = await queue.get()
+        try:
+            await _process(item)
+        except Exception as e:
+            logger.error(f"Signal worker error: {str(e)}")
+        finally:
+            queue.task_done()
+
+async def _recover():
+    queue_collection = await get_database("signalQueue")
+    # A signal stopped mid-order may already have reached the broker, so it
+    # is flagged for review instead of being run a second time
+    stopped = await queue_collection.find({"status": "processing"}, {"releaseKey": 1}).to_list(None)
+    interrupted = await queue_collection.update_many(
+        {"status": "processing"},
+        {"$set": {"status": "interrupted", "finishedAt": _utc(clock.timestamp())}},
+    )
+    _counts["interrupted"] += interrupted.modified_count
+    if interrupted.modified_count:
+        logger.warning(f"Marked {interrupted.modified_count} signals interrupted during the last shutdown")
+    for signal in stopped:
+        await _release_claim(signal)
+
+    # Signals past SIGNAL_MAX_AGE are expired by the worker when they come up
+    pending = await queue_collection.find({"status": "queued"}).sort("_id", 1).to_list(None)
+    for signal in pending:
+        received = signal["receivedAt"].replace(tzinfo=timezone.utc).timestamp()
+        _partition(signal["key"]).put_nowait({
+            "_id": signal["_id"], "kind": signal["kind"], "key": signal["key"],
+            "payload": signal["payload"], "received": received, "releaseKey": signal.get("releaseKey"),
+        })
+    _counts["recovered"] += len(pending)
+    if pending:
+        logger.info(f"Re-queued {len(pending)} unfinished signals")
+
+async def start_signal_queue(workers=SIGNAL_WORKERS):
+    if _workers:
+        return
+    _partitions.extend(asyncio.Queue() for _ in range(workers))
+    await _recover()
+    _workers.extend(asyncio.create_task(_worker(queue)) for queue in _partitions)
+
+async def stop_signal_queue():
+    for task in _workers:
+        task.cancel()
+    for task in _workers:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _workers.clear()
+    _partitions.clear()
+
+async def get_signal(signal_id):
+    queue_collection = await get_database("signalQueue")
+    return await queue_collection.find_one({"_id": signal_id})
+
+def _summarize(samples):
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "max": None}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+def get_queue_metrics():
+    return {
+        "depth": sum(queue.qsize() for queue in _partitions),
+        "partitions": [queue.qsize() for queue in _partitions],
+        **_counts,
+        "latency": {stage: _summarize(samples) for stage, samples in _latencies.items()},
+    }
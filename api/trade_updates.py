@@ -0,0 +1,154 @@
+"""
+Background subscriber to the Alpaca trade_updates stream.
+Order placement registers the order id and awaits a future that is
+resolved when the broker reports a terminal event for it.
+"""
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .alpaca_client import ACCOUNTS
+import asyncio
+import json
+import logging
+import os
+import websockets
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ALPACA_STREAM_URL = os.getenv("ALPACA_STREAM_URL", "wss://paper-api.alpaca.markets/stream")
+TRADE_UPDATES_ENABLED = os.getenv("TRADE_UPDATES_ENABLED", "true").lower() == "true"
+ORDER_FILL_TIMEOUT = float(os.getenv("ORDER_FILL_TIMEOUT", "10"))
+
+# Events after which an order will not change any more
+TERMINAL_EVENTS = {"fill", "canceled", "expired", "rejected"}
+
+# Terminal updates kept for orders whose fill arrives before anyone waits on it
+RECENT_UPDATES_LIMIT = 1000
+
+class TradeUpdatesStream:
+    def __init__(self, key, secret, url=ALPACA_STREAM_URL):
+        self.key = key
+        self.secret = secret
+        self.url = url
+        self.connected = False
+        self._waiters = {}
+        self._recent = OrderedDict()
+        self._task = None
+
+    async def wait_for_fill(self, order_id, timeout=ORDER_FILL_TIMEOUT):
+        """
+        Wait for the terminal update of an order and return its order dict.
+        Raises asyncio.TimeoutError if nothing arrives in time, or
+        ConnectionError if the stream drops first.
+        """
+        if order_id in self._recent:
+            return self._recent[order_id]
+
+        future = self._waiters.get(order_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[order_id] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._waiters.pop(order_id, None)
+
+    def handle_message(self, message):
+        if isinstance(message, bytes):
+            message = message.decode()
+        payload = json.loads(message)
+
+        if payload.get("stream") != "trade_updates":
+            return
+        data = payload.get("data", {})
+        if data.get("event") not in TERMINAL_EVENTS:
+            return
+
+        order = data.get("order", {})
+        order_id = order.get("id")
+        if not order_id:
+            return
+
+        self._recent[order_id] = order
+        if len(self._recent) > RECENT_UPDATES_LIMIT:
+            self._recent.popitem(last=False)
+
+        future = self._waiters.pop(order_id, None)
+        if future is not None and not future.done():
+            future.set_result(order)
+
+    async def _authenticate(self, websocket):
+        await websocket.send(json.dumps({"action": "auth", "key": self.key, "secret": self.secret}))
+        reply = json.loads(await websocket.recv())
+        if reply.get("data", {}).get("status") != "authorized":
+            raise ConnectionError(f"Trade updates stream not authorized: {reply}")
+        await websocket.send(json.dumps({"action": "listen", "data": {"streams": ["trade_updates"]}}))
+
+    async def run(self):
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    await self._authenticate(websocket)
+                    self.connected = True
+                    delay = 1
+                    logger.info(f"Connected to trade updates stream {self.url}")
+                    async for message in websocket:
+                        self.handle_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Trade updates stream disconnected: {str(e)}")
+            finally:
+                self.connected = False
+            # Updates sent while disconnected are lost; waiters fall back to polling
+            self._fail_waiters(ConnectionError("Trade updates stream disconnected"))
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _fail_waiters(self, error):
+        for future in self._waiters.values():
+            if not future.done():
+                future.set_exception(error)
+        self._waiters.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self.connected = False
+        for future in self._waiters.values():
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
+
+_streams = {}
+
+def get_trade_updates_stream(account: str) -> TradeUpdatesStream:
+    stream = _streams.get(account)
+    if stream is None:
+        key_env, secret_env = ACCOUNTS[account]
+        stream = TradeUpdatesStream(os.getenv(key_env), os.getenv(secret_env))
+        _streams[account] = stream
+    return stream
+
+def start_trade_updates(accounts):
+    if not TRADE_UPDATES_ENABLED:
+        return
+    for account in accounts:
+        get_trade_updates_stream(account).start()
+
+async def stop_trade_updates():
+    for stream in _streams.values():
+        await stream.stop()
@@ -0,0 +1,99 @@
+"""
+Small in-process TTL cache for async loaders.
+Concurrent callers of an expired key share a single in-flight load.
+With `stale_ttl`, an expired entry is still served for that long while
+one background refresh replaces it (stale-while-revalidate).
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    def __init__(self, ttl: float, stale_ttl: float = 0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._inflight = {}
+        self.metrics = {"hits": 0, "stale_hits": 0, "misses": 0, "loads": 0, "load_errors": 0}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, fresh_until, _ = entry
+        if time.monotonic() >= fresh_until:
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (value, now + ttl, now + ttl + self.stale_ttl)
+        if len(self._entries) > self.max_entries:
+            self._prune(now)
+
+    def _prune(self, now):
+        for key in [key for key, (_, _, stale_until) in self._entries.items() if stale_until <= now]:
+            del self._entries[key]
+        # Still full: drop the oldest insertions
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get_or_load(self, key, loader, ttl=None):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fresh_until, stale_until = entry
+            now = time.monotonic()
+            if now < fresh_until:
+                self.metrics["hits"] += 1
+                return value
+            if now < stale_until:
+                self.metrics["stale_hits"] += 1
+                self._start_load(key, loader, ttl)
+                return value
+
+        self.metrics["misses"] += 1
+        # Shield so one cancelled caller does not cancel the shared load
+        return await asyncio.shield(self._start_load(key, loader, ttl))
+
+    def _start_load(self, key, loader, ttl):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, ttl))
+            task.add_done_callback(self._log_failure)
+            self._inflight[key] = task
+        return task
+
+    async def _load(self, key, loader, ttl):
+        try:
+            self.metrics["loads"] += 1
+            value = await loader()
+            self.set(key, value, ttl)
+            return value
+        except Exception:
+            self.metrics["load_errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _log_failure(self, task):
+        # Background refreshes have no awaiting caller; retrieve their error here
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Cache load failed: {str(task.exception())}")
+
+    def get_metrics(self):
+        lookups = self.metrics["hits"] + self.metrics["stale_hits"] + self.metrics["misses"]
+        return {
+            **self.metrics,
+            "entries": len(self._entries),
+            "hit_ratio": (self.metrics["hits"] + self.metrics["stale_hits"]) / lookups if lookups else None,
+        }
@@ -0,0 +1,60 @@
+"""
+Response shaping for the large list endpoints.
+`layout=columnar` sends one array per field instead of one dict per row,
+`fields=a,b` keeps only the listed columns, and the Accept header picks
+MessagePack or JSON. orjson and msgpack are optional; without them the
+standard JSON encoder is used.
+"""
+from typing import Literal, Optional
+from fastapi import Request
+from fastapi.responses import Response
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+Layout = Literal["rows", "columnar"]
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+def parse_fields(fields: Optional[str]):
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+def to_columns(rows, fields=None):
+    # Without a projection, columns are every key in first-seen order
+    if fields is None:
+        fields = list(dict.fromkeys(key for row in rows for key in row))
+    return {
+        "fields": fields,
+        "columns": {field: [row.get(field) for row in rows] for field in fields},
+        "count": len(rows),
+    }
+
+def shape_rows(rows, layout: Layout = "rows", fields: Optional[str] = None):
+    """Apply the projection and layout to a list of dicts."""
+    selected = parse_fields(fields)
+    if layout == "columnar":
+        return to_columns(rows, selected)
+    if selected is None:
+        return rows
+    return [{field: row.get(field) for field in selected} for row in rows]
+
+def wants_msgpack(request: Request):
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+def render(request: Request, payload):
+    if wants_msgpack(request):
+        return Response(msgpack.packb(payload, default=str), media_type="application/msgpack")
+    if orjson is not None:
+        return Response(orjson.dumps(payload, default=str), media_type="application/json")
+    return Response(json.dumps(payload, default=str), media_type="application/json")
@@ -0,0 +1,105 @@
+"""
+Latency benchmark for /account with a simulated broker.
+Dashboard clients poll the endpoint concurrently while every upstream call
+sleeps for a jittered broker latency. Reports p50/p99 for the old
+sequential calls, the concurrent load_account, and get_account behind
+account_cache.
+
+Run from the repo root: python -m benchmarks.bench_account
+"""
+import asyncio
+import logging
+import random
+import time
+
+import api.index as index
+from api.ttl_cache import TTLCache
+
+# Typical broker latencies in seconds (mean, jitter)
+LATENCIES = {"history": (0.120, 0.040), "positions": (0.060, 0.020), "orders": (0.030, 0.010), "account": (0.050, 0.015)}
+CLIENTS = 20
+POLL_INTERVAL = 0.25
+DURATION = 3.0
+CACHE_TTL = 1.0
+
+rng = random.Random(1)
+
+async def broker_call(name, payload):
+    mean, jitter = LATENCIES[name]
+    await asyncio.sleep(max(0.0, rng.gauss(mean, jitter)))
+    return payload
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def json(self):
+        return self.payload
+
+class FakeAlpaca:
+    def __init__(self):
+        self.calls = 0
+
+    async def _call(self, name, payload):
+        self.calls += 1
+        return FakeResponse(await broker_call(name, payload))
+
+    def get_portfolio_history(self, params=None):
+        return self._call("history", {"equity": [100000.0] * 390})
+
+    def get_positions(self):
+        return self._call("positions", [{"symbol": "UVIX", "qty": "10"}])
+
+    def get_account(self):
+        return self._call("account", {"equity": "100000"})
+
+ORDERS = [{"side": "buy" if i % 2 else "sell", "filled_qty": "1"} for i in range(500)]
+alpaca = FakeAlpaca()
+
+async def fake_closed_orders(account):
+    alpaca.calls += 1
+    return await broker_call("orders", ORDERS)
+
+async def sequential_account():
+    # The pre-change handler: four awaited broker calls, one after another
+    history = (await alpaca.get_portfolio_history()).json()
+    positions = (await alpaca.get_positions()).json()
+    orders = await fake_closed_orders("stock")
+    account = (await alpaca.get_account()).json()
+    return {"portfolio_history": history, "positions": positions, "account_info": account, "orders": orders}
+
+async def poll(handler, latencies, deadline):
+    await asyncio.sleep(rng.uniform(0, POLL_INTERVAL))
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await handler()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(POLL_INTERVAL)
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run(name, handler):
+    alpaca.calls = 0
+    latencies = []
+    deadline = time.perf_counter() + DURATION
+    await asyncio.gather(*(poll(handler, latencies, deadline) for _ in range(CLIENTS)))
+    print(f"{name:<28} requests {len(latencies):>4}  broker calls {alpaca.calls:>4}  "
+          f"p50 {percentile(latencies, 0.5) * 1000:>6.1f} ms  p99 {percentile(latencies, 0.99) * 1000:>6.1f} ms")
+
+async def main():
+    logging.disable(logging.INFO)
+    index.get_alpaca_client = lambda account: alpaca
+    index.get_closed_orders = fake_closed_orders
+    index.account_cache = TTLCache(CACHE_TTL)
+
+    print(f"{CLIENTS} clients polling every {POLL_INTERVAL}s for {DURATION}s, cache TTL {CACHE_TTL}s")
+    await run("sequential (before)", sequential_account)
+    await run("concurrent load_account", index.load_account)
+    await run("cached get_account", index.get_account)
+    print(f"cache: {index.account_cache.metrics}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""
+Benchmark for merge_options_data on a realistic chain: 10000 contracts
+from the contracts endpoint and 1000 snapshots with quotes. Compares the
+old per-snapshot scan of the contract list with the current hash join.
+
+Run from the repo root: python -m benchmarks.bench_merge_options
+"""
+from datetime import date, timedelta
+import random
+import timeit
+
+from api.routes.brokerage import merge_options_data
+
+def old_merge_options_data(options_data, contract_data):
+    # The implementation merge_options_data replaced: one contract scan per snapshot
+    merged_array = []
+    if options_data and contract_data:
+        if 'snapshots' in options_data and 'option_contracts' in contract_data:
+            for key, snapshot in options_data['snapshots'].items():
+                matching_contract = None
+                for contract in contract_data['option_contracts']:
+                    if contract['symbol'] == key:
+                        matching_contract = contract
+                        break
+                if matching_contract:
+                    latest_quote = snapshot.get('latestQuote', {})
+                    greeks = snapshot.get('greeks', {})
+                    merged_data = {
+                        'symbol': key,
+                        'bidPrice': latest_quote.get('bp'),
+                        'askPrice': latest_quote.get('ap'),
+                        'delta': greeks.get('delta'),
+                        'gamma': greeks.get('gamma'),
+                        'theta': greeks.get('theta'),
+                        'vega': greeks.get('vega'),
+                    }
+                    merged_data.update(matching_contract)
+                    merged_array.append(merged_data)
+    return merged_array
+
+def make_chain(contract_count, snapshot_count, seed=1):
+    rng = random.Random(seed)
+    first = date(2025, 1, 3)
+    contracts = []
+    for i in range(contract_count):
+        expiry = first + timedelta(weeks=i % 52)
+        strike = 100 + (i // 104) * 5
+        option_type = "call" if i % 2 else "put"
+        symbol = f"SPY{expiry:%y%m%d}{option_type[0].upper()}{strike * 1000:08d}"
+        contracts.append({
+            "id": f"contract-{i}", "symbol": symbol, "name": symbol, "status": "active",
+            "tradable": True, "expiration_date": expiry.isoformat(), "root_symbol": "SPY",
+            "underlying_symbol": "SPY", "type": option_type, "style": "american",
+            "strike_price": str(strike), "size": "100", "open_interest": str(rng.randrange(5000)),
+        })
+    snapshots = {}
+    for contract in rng.sample(contracts, snapshot_count):
+        bid = round(rng.uniform(0.05, 20), 2)
+        snapshots[contract["symbol"]] = {
+            "latestQuote": {"bp": bid, "ap": round(bid + rng.uniform(0.01, 0.5), 2)},
+            "latestTrade": {"p": bid},
+            "dailyBar": {"v": rng.randrange(10000)},
+            "impliedVolatility": rng.uniform(0.1, 0.8),
+            "greeks": {"delta": rng.uniform(-1, 1), "gamma": 0.01, "theta": -0.05, "vega": 0.1},
+        }
+    return {"snapshots": snapshots}, {"option_contracts": contracts}
+
+def main():
+    for contract_count, snapshot_count in ((2000, 200), (10000, 1000)):
+        options_data, contract_data = make_chain(contract_count, snapshot_count)
+        assert len(old_merge_options_data(options_data, contract_data)) == len(merge_options_data(options_data, contract_data))
+        old = min(timeit.repeat(lambda: old_merge_options_data(options_data, contract_data), number=1, repeat=3))
+        new = min(timeit.repeat(lambda: merge_options_data(options_data, contract_data), number=5, repeat=3)) / 5
+        print(f"{contract_count} contracts / {snapshot_count} snapshots: "
+              f"nested loop {old * 1000:.1f} ms, hash join {new * 1000:.2f} ms ({old / new:.0f}x)")
+
+if __name__ == "__main__":
+    main()
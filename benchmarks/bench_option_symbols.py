@@ -0,0 +1,59 @@
+"""
+Microbenchmark for the OCC symbol parser.
+Compares the old character-loop parse_option_date with parse_option_symbol
+uncached and cached, on a position-sized and a chain-sized symbol list.
+
+Run from the repo root: python -m benchmarks.bench_option_symbols
+"""
+from datetime import date, timedelta
+import random
+import timeit
+
+from api.routes.utils import parse_option_symbol
+
+def old_parse_option_date(symbol):
+    # The implementation parse_option_symbol replaced: month and day only
+    date_start = 0
+    for i, char in enumerate(symbol):
+        if char.isdigit():
+            date_start = i
+            break
+    date_portion = symbol[date_start:date_start + 6]
+    return date_portion[2:4], date_portion[4:6]
+
+def make_symbols(count, seed=1):
+    rng = random.Random(seed)
+    roots = ["SPY", "QQQ", "AAPL", "TSLA", "NVDA", "AMZN", "IWM", "UVIX"]
+    first = date(2025, 1, 3)
+    symbols = []
+    for _ in range(count):
+        expiry = first + timedelta(weeks=rng.randrange(80))
+        strike = rng.randrange(5, 900) * 1000 + rng.choice([0, 500])
+        symbols.append(f"{rng.choice(roots)}{expiry:%y%m%d}{rng.choice('CP')}{strike:08d}")
+    return symbols
+
+def report(name, seconds, count):
+    print(f"{name:<42} {seconds / count * 1e9:>10.0f} ns/symbol")
+
+def main():
+    for count in (500, 5000):
+        symbols = make_symbols(count)
+        repeat = max(1, 50000 // count)
+        print(f"\n{count} symbols, {repeat} passes")
+
+        report("old parse_option_date (month/day only)",
+               min(timeit.repeat(lambda: [old_parse_option_date(s) for s in symbols], number=repeat, repeat=3)),
+               count * repeat)
+        report("parse_option_symbol, uncached",
+               min(timeit.repeat(lambda: [parse_option_symbol.__wrapped__(s) for s in symbols], number=repeat, repeat=3)),
+               count * repeat)
+
+        parse_option_symbol.cache_clear()
+        [parse_option_symbol(s) for s in symbols]
+        report("parse_option_symbol, cached",
+               min(timeit.repeat(lambda: [parse_option_symbol(s) for s in symbols], number=repeat, repeat=3)),
+               count * repeat)
+        print(f"cache: {parse_option_symbol.cache_info()}")
+
+if __name__ == "__main__":
+    main()
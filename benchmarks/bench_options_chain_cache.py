@@ -0,0 +1,119 @@
+"""
+Benchmark for the options chain caches under many concurrent users.
+Users poll a few popular chains against a simulated paginated broker.
+Reports upstream request counts and p50/p99 latency for uncached fetches
+and for fetch_options_chain behind the contract, snapshot and quote caches.
+
+Run from the repo root: python -m benchmarks.bench_options_chain_cache
+"""
+import asyncio
+import random
+import time
+
+import api.routes.brokerage as brokerage
+from api.ttl_cache import TTLCache
+
+CHAINS = [("SPY", "call", "2025-06-20"), ("SPY", "put", "2025-06-20"), ("QQQ", "call", "2025-06-20")]
+USERS = 50
+POLL_INTERVAL = 0.5
+DURATION = 4.0
+SNAPSHOT_TTL = 1.0
+SNAPSHOT_STALE_TTL = 5.0
+# Simulated broker: latency per page and chain size
+PAGE_LATENCY = (0.150, 0.050)
+QUOTE_LATENCY = (0.040, 0.010)
+CONTRACTS_PER_CHAIN = 2000
+SNAPSHOT_PAGE_SIZE = 1000
+
+rng = random.Random(1)
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+        self.text = ""
+
+    def json(self):
+        return self.payload
+
+class FakeAlpaca:
+    def __init__(self):
+        self.calls = {"snapshots": 0, "contracts": 0, "quote": 0}
+
+    async def _respond(self, name, latency, payload):
+        self.calls[name] += 1
+        await asyncio.sleep(max(0.0, rng.gauss(*latency)))
+        return FakeResponse(payload)
+
+    def _symbols(self, symbol, option_type, date):
+        flag = "C" if option_type == "call" else "P"
+        return [f"{symbol}{date[2:4]}{date[5:7]}{date[8:10]}{flag}{(100 + i) * 1000:08d}" for i in range(CONTRACTS_PER_CHAIN)]
+
+    def get_option_snapshots(self, symbol, params):
+        symbols = self._symbols(symbol, params["type"], params["expiration_date"])
+        page = int(params.get("page_token") or 0)
+        chunk = symbols[page * SNAPSHOT_PAGE_SIZE:(page + 1) * SNAPSHOT_PAGE_SIZE]
+        more = (page + 1) * SNAPSHOT_PAGE_SIZE < len(symbols)
+        return self._respond("snapshots", PAGE_LATENCY, {
+            "snapshots": {s: {"latestQuote": {"bp": 1.0, "ap": 1.1}} for s in chunk},
+            "next_page_token": str(page + 1) if more else None,
+        })
+
+    def get_option_contracts(self, params):
+        symbols = self._symbols(params["underlying_symbols"], params["type"], params["expiration_date"])
+        return self._respond("contracts", PAGE_LATENCY, {"option_contracts": [
+            {"symbol": s, "type": params["type"], "strike_price": str(100 + i), "expiration_date": params["expiration_date"]}
+            for i, s in enumerate(symbols)
+        ]})
+
+    def get_latest_stock_quote(self, symbol):
+        return self._respond("quote", QUOTE_LATENCY, {"quote": {"bp": 500.0, "ap": 500.1}})
+
+alpaca = FakeAlpaca()
+
+async def uncached_chain(symbol, option_type, date):
+    # Every request goes to the broker, as before the caches existed
+    chain_params = {"feed": "indicative", "limit": 1000, "type": option_type, "expiration_date": date}
+    contract_params = {"underlying_symbols": symbol, "status": "active", "expiration_date": date, "type": option_type, "limit": 10000}
+    return await asyncio.gather(
+        brokerage.fetch_all_pages(lambda params: alpaca.get_option_snapshots(symbol, params), chain_params, "snapshots"),
+        brokerage.fetch_contracts(alpaca, contract_params),
+        alpaca.get_latest_stock_quote(symbol),
+    )
+
+async def user(fetch, latencies, deadline):
+    await asyncio.sleep(rng.uniform(0, POLL_INTERVAL))
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await fetch(*rng.choice(CHAINS))
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(POLL_INTERVAL)
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run(name, fetch):
+    alpaca.calls = dict.fromkeys(alpaca.calls, 0)
+    latencies = []
+    deadline = time.perf_counter() + DURATION
+    await asyncio.gather(*(user(fetch, latencies, deadline) for _ in range(USERS)))
+    upstream = ", ".join(f"{kind} {count}" for kind, count in alpaca.calls.items())
+    print(f"{name:<10} requests {len(latencies):>4}  p50 {percentile(latencies, 0.5) * 1000:>6.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:>6.1f} ms  upstream: {upstream}")
+
+async def main():
+    brokerage.get_alpaca_client = lambda account: alpaca
+    brokerage.contract_cache = TTLCache(24 * 60 * 60)
+    brokerage.snapshot_cache = TTLCache(SNAPSHOT_TTL, stale_ttl=SNAPSHOT_STALE_TTL)
+    brokerage.quote_cache = TTLCache(SNAPSHOT_TTL, stale_ttl=SNAPSHOT_STALE_TTL)
+
+    print(f"{USERS} users on {len(CHAINS)} chains, polling every {POLL_INTERVAL}s for {DURATION}s, "
+          f"snapshot TTL {SNAPSHOT_TTL}s + {SNAPSHOT_STALE_TTL}s stale")
+    await run("uncached", uncached_chain)
+    await run("cached", brokerage.fetch_options_chain)
+    for name in ("contract_cache", "snapshot_cache", "quote_cache"):
+        print(f"{name}: {getattr(brokerage, name).metrics}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
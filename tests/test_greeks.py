@@ -0,0 +1,66 @@
+import math
+import time
+
+import numpy as np
+
+from api.greeks import RISK_FREE_RATE, bs_vega, chain_greeks, implied_volatility
+
+def reference_price(spot, strike, years, sigma, is_call, rate=RISK_FREE_RATE):
+    # Scalar Black-Scholes with the exact normal CDF from math.erf
+    cdf = lambda x: 0.5 * (1 + math.erf(x / math.sqrt(2)))
+    d1 = (math.log(spot / strike) + (rate + 0.5 * sigma * sigma) * years) / (sigma * math.sqrt(years))
+    d2 = d1 - sigma * math.sqrt(years)
+    if is_call:
+        return spot * cdf(d1) - strike * math.exp(-rate * years) * cdf(d2)
+    return strike * math.exp(-rate * years) * cdf(-d2) - spot * cdf(-d1)
+
+def random_chain(n, seed=7):
+    rng = np.random.default_rng(seed)
+    spot = 100.0
+    strike = rng.uniform(60, 140, n)
+    years = rng.uniform(2 / 365, 1.0, n)
+    sigma = rng.uniform(0.08, 1.2, n)
+    is_call = rng.random(n) < 0.5
+    price = np.array([reference_price(spot, k, t, s, c) for k, t, s, c in zip(strike, years, sigma, is_call)])
+    return spot, strike, years, sigma, is_call, price
+
+def test_implied_volatility_round_trip():
+    spot, strike, years, sigma, is_call, price = random_chain(2000)
+    iv = implied_volatility(price, spot, strike, years, is_call)
+
+    # Contracts with almost no vega carry no information about sigma
+    informative = bs_vega(spot, strike, years, sigma) > 0.05
+    assert informative.sum() > 1500
+    assert np.all(np.isfinite(iv[informative]))
+    assert np.max(np.abs(iv[informative] - sigma[informative])) < 1e-3
+
+def test_delta_signs_and_bounds():
+    spot, strike, years, sigma, is_call, price = random_chain(1000, seed=11)
+    greeks = chain_greeks(spot, strike, years, is_call, price * 0.995, price * 1.005)
+    solved = np.isfinite(greeks["iv"])
+    delta = greeks["delta"]
+
+    assert np.all((delta[solved & is_call] >= 0) & (delta[solved & is_call] <= 1))
+    assert np.all((delta[solved & ~is_call] >= -1) & (delta[solved & ~is_call] <= 0))
+    assert np.all(greeks["gamma"][solved] >= 0)
+    assert np.all(greeks["vega"][solved] >= 0)
+
+def test_prices_outside_no_arbitrage_bounds_are_nan():
+    spot, years = 100.0, 0.25
+    # Below intrinsic value, above the underlying, and a call worth nothing
+    iv = implied_volatility([5.0, 120.0, 0.0], spot, [90.0, 100.0, 100.0], years, [True, True, True])
+    assert np.all(np.isnan(iv))
+
+def test_missing_quotes_give_nan_greeks():
+    greeks = chain_greeks(100.0, [100.0, 100.0], [0.25, 0.25], [True, False], [0.0, np.nan], [1.0, 2.0])
+    for values in greeks.values():
+        assert np.all(np.isnan(values))
+
+def test_full_chain_speed():
+    spot, strike, years, sigma, is_call, price = random_chain(5000, seed=3)
+    chain_greeks(spot, strike, years, is_call, price, price)  # warm up
+
+    start = time.perf_counter()
+    chain_greeks(spot, strike, years, is_call, price * 0.995, price * 1.005)
+    # Loose bound so slow CI machines pass; locally this is ~10-20 ms
+    assert time.perf_counter() - start < 0.5
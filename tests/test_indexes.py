@@ -0,0 +1,60 @@
+import ast
+import pathlib
+
+from api.indexes import INDEXES, QUERY_PATTERNS, find_unindexed_queries, index_covers
+
+API_DIR = pathlib.Path(__file__).resolve().parent.parent / "api"
+# Collection methods that filter or sort documents
+QUERY_METHODS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "find_one_and_replace",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "count_documents", "distinct", "aggregate", "bulk_write",
+}
+
+def query_call_sites():
+    """(module.function, line) for every query method call in api/."""
+    sites = []
+    for path in sorted(API_DIR.rglob("*.py")):
+        module = ".".join(path.relative_to(API_DIR).with_suffix("").parts)
+        tree = ast.parse(path.read_text(), str(path))
+
+        def visit(node, function):
+            for child in ast.iter_child_nodes(node):
+                name = function
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    # Queries in nested helpers belong to the outer function
+                    name = function or child.name
+                if (isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute)
+                        and child.func.attr in QUERY_METHODS):
+                    sites.append((f"{module}.{name}", child.lineno))
+                visit(child, name)
+
+        visit(tree, None)
+    return sites
+
+def test_every_query_call_site_has_a_pattern():
+    listed = {pattern["where"] for pattern in QUERY_PATTERNS}
+    missing = [f"{where} (line {line})" for where, line in query_call_sites() if where not in listed]
+    assert not missing, f"Queries without a QUERY_PATTERNS entry: {missing}"
+
+def test_every_pattern_has_a_call_site():
+    called = {where for where, _ in query_call_sites()}
+    stale = sorted({pattern["where"] for pattern in QUERY_PATTERNS} - called)
+    assert not stale, f"QUERY_PATTERNS entries with no query: {stale}"
+
+def test_every_pattern_is_indexed():
+    assert find_unindexed_queries() == []
+
+def test_pattern_collections_exist():
+    # A typo in a collection name would otherwise pass as an unindexed query
+    used = {pattern["collection"] for pattern in QUERY_PATTERNS if pattern["filter"] and "_id" not in pattern["filter"]}
+    assert used <= set(INDEXES)
+
+def test_index_covers():
+    keys = [("account", 1), ("submittedAt", -1)]
+    assert index_covers(keys, ["account"], [("submittedAt", -1)])
+    assert index_covers(keys, ["account"], [("submittedAt", 1)])
+    assert index_covers(keys, ["account"], [])
+    assert not index_covers(keys, ["status"], [])
+    assert not index_covers(keys, ["account", "status"], [])
+    assert not index_covers(keys, [], [("account", 1), ("submittedAt", 1)])
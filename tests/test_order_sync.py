@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import api.order_sync as order_sync
+
+T0 = datetime(2025, 3, 3, 14, 30, tzinfo=timezone.utc)
+
+def make_order(order_id, submitted, status="filled"):
+    return {"id": order_id, "status": status, "side": "buy", "filled_qty": "1",
+            "submitted_at": submitted.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+        self.text = ""
+
+    def json(self):
+        return self.payload
+
+class FakeBroker:
+    def __init__(self, orders):
+        self.orders = {order["id"]: order for order in orders}
+        self.requests = []
+
+    async def get_orders(self, params=None, priority=None):
+        self.requests.append(params)
+        if params["status"] == "open":
+            return FakeResponse([o for o in self.orders.values() if o["status"] not in order_sync.TERMINAL_STATUSES])
+        after = order_sync.parse_timestamp(params["after"])
+        page = sorted(
+            (o for o in self.orders.values() if order_sync.parse_timestamp(o["submitted_at"]) > after),
+            key=lambda o: o["submitted_at"],
+        )
+        return FakeResponse([dict(o) for o in page[:params["limit"]]])
+
+    async def get_order(self, order_id, params=None, priority=None):
+        return FakeResponse(dict(self.orders[order_id]))
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction):
+        self.documents.sort(key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    async def to_list(self, length):
+        return self.documents
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = []
+
+    def _matches(self, document, query):
+        for field, condition in query.items():
+            if isinstance(condition, dict):
+                if "$nin" in condition and document.get(field) in condition["$nin"]:
+                    return False
+                if "$in" in condition and document.get(field) not in condition["$in"]:
+                    return False
+            elif document.get(field) != condition:
+                return False
+        return True
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            query, update = operation._filter, operation._doc
+            existing = next((d for d in self.documents if self._matches(d, query)), None)
+            if existing is None:
+                self.documents.append(dict(update["$set"]))
+            else:
+                existing.update(update["$set"])
+
+    async def distinct(self, field, query):
+        return [d[field] for d in self.documents if self._matches(d, query)]
+
+    async def find_one(self, query, sort=None):
+        matches = [d for d in self.documents if self._matches(d, query)]
+        for field, direction in sort or []:
+            matches.sort(key=lambda d: d[field], reverse=direction < 0)
+        return matches[0] if matches else None
+
+    async def update_one(self, query, update, upsert=False):
+        existing = await self.find_one(query)
+        if existing is None:
+            self.documents.append({**query, **update["$set"]})
+        else:
+            existing.update(update["$set"])
+
+    def find(self, query, projection=None):
+        return FakeCursor([d for d in self.documents if self._matches(d, query)])
+
+def run_sync(broker, scenario, page_size=3):
+    collections = {"brokerOrders": FakeCollection(), "orderSyncState": FakeCollection()}
+
+    async def get_database(name):
+        return collections[name]
+
+    async def main():
+        original = order_sync.get_database, order_sync.get_alpaca_client, order_sync.ORDER_SYNC_PAGE_SIZE
+        order_sync.get_database = get_database
+        order_sync.get_alpaca_client = lambda account: broker
+        order_sync.ORDER_SYNC_PAGE_SIZE = page_size
+        order_sync._last_sync.clear()
+        try:
+            await scenario(collections)
+        finally:
+            order_sync.get_database, order_sync.get_alpaca_client, order_sync.ORDER_SYNC_PAGE_SIZE = original
+
+    asyncio.run(main())
+
+def test_a_full_page_of_one_timestamp_does_not_stop_the_sync():
+    orders = [make_order(f"tie-{i}", T0) for i in range(4)]
+    orders += [make_order(f"later-{i}", T0 + timedelta(seconds=1 + i)) for i in range(4)]
+    broker = FakeBroker(orders)
+
+    async def scenario(collections):
+        await order_sync.sync_orders("stock", force=True)
+        mirrored = {d["id"] for d in collections["brokerOrders"].documents}
+        assert {f"later-{i}" for i in range(4)} <= mirrored
+
+    run_sync(broker, scenario)
+
+def test_orders_split_across_pages_at_one_timestamp_are_kept():
+    orders = [make_order("a", T0), make_order("b", T0 + timedelta(seconds=1)),
+              make_order("c", T0 + timedelta(seconds=2)), make_order("d", T0 + timedelta(seconds=2)),
+              make_order("e", T0 + timedelta(seconds=3))]
+    broker = FakeBroker(orders)
+
+    async def scenario(collections):
+        await order_sync.sync_orders("stock", force=True)
+        assert {d["id"] for d in collections["brokerOrders"].documents} == {"a", "b", "c", "d", "e"}
+
+    run_sync(broker, scenario)
+
+def test_old_open_order_does_not_hold_back_the_watermark():
+    broker = FakeBroker([
+        make_order("gtc", T0, status="new"),
+        *[make_order(f"filled-{i}", T0 + timedelta(minutes=1 + i)) for i in range(5)],
+    ])
+
+    async def scenario(collections):
+        await order_sync.sync_orders("stock", force=True)
+        watermark = collections["orderSyncState"].documents[0]["watermark"]
+        assert watermark == T0 + timedelta(minutes=5)
+
+        broker.orders["gtc"]["status"] = "filled"
+        broker.requests.clear()
+        await order_sync.sync_orders("stock", force=True)
+        # Only orders from the watermark on are listed again; the GTC order is re-read by id
+        listed = [r for r in broker.requests if r["status"] == "all"]
+        assert all(order_sync.parse_timestamp(r["after"]) >= watermark - timedelta(microseconds=1) for r in listed)
+        gtc = next(d for d in collections["brokerOrders"].documents if d["id"] == "gtc")
+        assert gtc["status"] == "filled"
+
+        closed = await order_sync.get_closed_orders("stock", limit=2)
+        assert [order["id"] for order in closed] == ["filled-4", "filled-3"]
+
+    run_sync(broker, scenario)
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from api.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_ORDER, PRIORITY_READ, TokenBucketLimiter
+
+def test_order_is_not_queued_behind_a_starved_read():
+    async def scenario():
+        # 6/min refills a token every 10s; three tokens are reserved for orders
+        limiter = TokenBucketLimiter(6, capacity=4, order_reserve=3)
+        await limiter.acquire(PRIORITY_READ)
+        read = asyncio.create_task(limiter.acquire(PRIORITY_READ))
+        await asyncio.sleep(0.01)
+        assert not read.done()
+
+        started = time.monotonic()
+        await asyncio.wait_for(limiter.acquire(PRIORITY_ORDER), 1)
+        assert time.monotonic() - started < 0.5
+        assert not read.done()
+        read.cancel()
+
+    asyncio.run(scenario())
+
+def test_queued_order_is_served_before_a_waiting_read():
+    async def scenario():
+        limiter = TokenBucketLimiter(600, capacity=1)
+        await limiter.acquire(PRIORITY_ORDER)
+        # The bucket is empty; the read queues first, the order after it
+        read = asyncio.create_task(limiter.acquire(PRIORITY_READ))
+        await asyncio.sleep(0.01)
+        order = asyncio.create_task(limiter.acquire(PRIORITY_ORDER))
+        done, _ = await asyncio.wait({read, order}, return_when=asyncio.FIRST_COMPLETED, timeout=1)
+        assert done == {order}
+        await asyncio.wait_for(read, 1)
+
+    asyncio.run(scenario())
+
+def test_reads_keep_the_order_reserve():
+    async def scenario():
+        limiter = TokenBucketLimiter(6, capacity=3, order_reserve=2)
+        await limiter.acquire(PRIORITY_BACKGROUND)
+        background = asyncio.create_task(limiter.acquire(PRIORITY_BACKGROUND))
+        await asyncio.sleep(0.01)
+        assert not background.done()
+        await asyncio.wait_for(limiter.acquire(PRIORITY_ORDER), 1)
+        await asyncio.wait_for(limiter.acquire(PRIORITY_ORDER), 1)
+        background.cancel()
+
+    asyncio.run(scenario())
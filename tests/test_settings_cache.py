@@ -0,0 +1,65 @@
+import asyncio
+
+import api.settings_cache as settings_cache
+
+class FakeCollection:
+    def __init__(self, document):
+        self.document = document
+        self.reads = 0
+
+    async def find_one(self, query):
+        self.reads += 1
+        # Yield so concurrent readers pile up behind the lock
+        await asyncio.sleep(0.01)
+        return dict(self.document)
+
+def run_with_fake_database(scenario):
+    collections = {
+        "settings": FakeCollection({"stockAmount": 100.0, "optionsAmount": 2.0}),
+        "startStopSettings": FakeCollection({"stockStart": True, "optionsStart": False}),
+    }
+
+    async def get_database(name):
+        return collections[name]
+
+    async def main():
+        original = settings_cache.get_database, settings_cache._snapshot, settings_cache._refresh_lock
+        settings_cache.get_database = get_database
+        settings_cache._snapshot = {"version": 0, "settings": None, "startStopSettings": None, "loaded_at": 0.0}
+        settings_cache._refresh_lock = asyncio.Lock()
+        try:
+            await scenario(collections)
+        finally:
+            settings_cache.get_database, settings_cache._snapshot, settings_cache._refresh_lock = original
+
+    asyncio.run(main())
+
+def test_concurrent_readers_share_one_reload():
+    async def scenario(collections):
+        results = await asyncio.gather(*(settings_cache.get_cached_settings() for _ in range(20)))
+        assert all(result["stockAmount"] == 100.0 for result in results)
+        assert collections["settings"].reads == 1
+
+        # Expire the snapshot; the next wave of readers reloads once more
+        settings_cache._snapshot["loaded_at"] -= settings_cache.SETTINGS_CACHE_TTL + 1
+        await asyncio.gather(*(settings_cache.get_cached_start_stop_settings() for _ in range(20)))
+        assert collections["startStopSettings"].reads == 2
+
+    run_with_fake_database(scenario)
+
+def test_callers_cannot_change_the_cached_settings():
+    async def scenario(collections):
+        settings = await settings_cache.get_cached_settings()
+        settings["stockAmount"] = 0
+        assert (await settings_cache.get_cached_settings())["stockAmount"] == 100.0
+
+    run_with_fake_database(scenario)
+
+def test_writes_always_reload():
+    async def scenario(collections):
+        await settings_cache.get_cached_settings()
+        collections["settings"].document["stockAmount"] = 250.0
+        await settings_cache.refresh_settings()
+        assert (await settings_cache.get_cached_settings())["stockAmount"] == 250.0
+
+    run_with_fake_database(scenario)
@@ -0,0 +1,113 @@
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+
+import api.signal_dedup as signal_dedup
+import api.signal_queue as signal_queue
+
+class FakeResult:
+    def __init__(self, inserted_id=None, modified_count=0):
+        self.inserted_id = inserted_id
+        self.modified_count = modified_count
+
+class FakeCollection:
+    """Just enough of a motor collection for the dedup and queue code."""
+    def __init__(self):
+        self.documents = {}
+
+    def _matches(self, document, query):
+        for field, condition in query.items():
+            value = document.get(field)
+            if isinstance(condition, dict):
+                if "$lte" in condition and not (value is not None and value <= condition["$lte"]):
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    async def insert_one(self, document):
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError("duplicate key")
+        self.documents[document["_id"]] = dict(document)
+        return FakeResult(inserted_id=document["_id"])
+
+    async def find_one(self, query):
+        return next((doc for doc in self.documents.values() if self._matches(doc, query)), None)
+
+    async def update_one(self, query, update):
+        document = await self.find_one(query)
+        if document is None:
+            return FakeResult()
+        document.update(update["$set"])
+        return FakeResult(modified_count=1)
+
+    async def delete_one(self, query):
+        document = await self.find_one(query)
+        if document is not None:
+            del self.documents[document["_id"]]
+
+def run_with_fake_database(scenario):
+    collections = {"signalQueue": FakeCollection(), "signalFingerprints": FakeCollection()}
+
+    async def get_database(name):
+        return collections[name]
+
+    async def main():
+        signal_dedup._claims.clear()
+        original = signal_queue.get_database, signal_dedup.get_database
+        signal_queue.get_database = signal_dedup.get_database = get_database
+        try:
+            return await scenario(collections)
+        finally:
+            signal_queue.get_database, signal_dedup.get_database = original
+            signal_queue._handlers.pop("test", None)
+
+    return asyncio.run(main())
+
+def test_buy_sell_buy_of_the_same_signal_all_run():
+    async def scenario(collections):
+        handled = []
+
+        async def handler(payload):
+            handled.append(payload["action"])
+
+        signal_queue.register_handler("test", handler)
+        buy = {"action": "buy", "symbol": "UVIX", "quantity": 10}
+        sell = {"action": "sell", "symbol": "UVIX", "quantity": 10}
+        states = [(await signal_queue.enqueue_signal("test", "UVIX", payload))[1] for payload in (buy, sell, buy)]
+        assert states == ["processed", "processed", "processed"]
+        assert handled == ["buy", "sell", "buy"]
+        assert not collections["signalFingerprints"].documents
+
+    run_with_fake_database(scenario)
+
+def test_repeat_of_a_pending_signal_is_a_duplicate():
+    async def scenario(collections):
+        release_handler = asyncio.Event()
+
+        async def handler(payload):
+            await release_handler.wait()
+
+        signal_queue.register_handler("test", handler)
+        buy = {"action": "buy", "symbol": "UVIX", "quantity": 10}
+        first = asyncio.create_task(signal_queue.enqueue_signal("test", "UVIX", buy))
+        await asyncio.sleep(0)
+        retry_id, retry_state = await signal_queue.enqueue_signal("test", "UVIX", dict(buy))
+        release_handler.set()
+        first_id, first_state = await first
+        assert (retry_id, retry_state) == (first_id, "duplicate")
+        assert first_state == "processed"
+
+    run_with_fake_database(scenario)
+
+def test_explicit_id_stays_claimed_after_the_signal_finishes():
+    async def scenario(collections):
+        async def handler(payload):
+            return None
+
+        signal_queue.register_handler("test", handler)
+        buy = {"action": "buy", "symbol": "UVIX", "quantity": 10}
+        first_id, _ = await signal_queue.enqueue_signal("test", "UVIX", buy, explicit_id="alert-1")
+        assert await signal_queue.enqueue_signal("test", "UVIX", buy, explicit_id="alert-1") == (first_id, "duplicate")
+
+    run_with_fake_database(scenario)
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+
+import websockets
+
+import api.index as index
+from api.trade_updates import TradeUpdatesStream
+
+class FakeStreamServer:
+    """Local stand-in for the Alpaca trade_updates websocket."""
+    def __init__(self, close_after_listen=False):
+        self.close_after_listen = close_after_listen
+        self.received = []
+        self.connections = []
+        self._server = None
+
+    async def _handler(self, websocket):
+        auth = json.loads(await websocket.recv())
+        self.received.append(auth)
+        status = "authorized" if auth.get("key") == "key" else "unauthorized"
+        await websocket.send(json.dumps({"stream": "authorization", "data": {"action": "authenticate", "status": status}}))
+        self.received.append(json.loads(await websocket.recv()))
+        await websocket.send(json.dumps({"stream": "listening", "data": {"streams": ["trade_updates"]}}))
+        if self.close_after_listen:
+            return
+        self.connections.append(websocket)
+        await websocket.wait_closed()
+
+    async def send_update(self, event, order):
+        message = json.dumps({"stream": "trade_updates", "data": {"event": event, "order": order}})
+        for websocket in self.connections:
+            await websocket.send(message)
+
+    async def disconnect(self):
+        for websocket in self.connections:
+            await websocket.close()
+        self.connections.clear()
+
+    async def __aenter__(self):
+        self._server = await websockets.serve(self._handler, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+async def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+class FakeAlpaca:
+    def __init__(self, status):
+        self.status = status
+        self.polls = 0
+
+    async def get_order(self, order_id, params=None):
+        self.polls += 1
+        return FakeResponse({"id": order_id, "status": self.status, "filled_qty": "1", "filled_avg_price": "2.5"})
+
+def run_with_stream(scenario, close_after_listen=False, alpaca=None):
+    async def main():
+        async with FakeStreamServer(close_after_listen) as server:
+            stream = TradeUpdatesStream("key", "secret", server.url)
+            original = index.get_trade_updates_stream, index.get_alpaca_client
+            index.get_trade_updates_stream = lambda account: stream
+            index.get_alpaca_client = lambda account: alpaca
+            try:
+                stream.start()
+                await scenario(server, stream)
+            finally:
+                index.get_trade_updates_stream, index.get_alpaca_client = original
+                await stream.stop()
+
+    asyncio.run(main())
+
+def test_authenticates_and_listens():
+    async def scenario(server, stream):
+        await wait_until(lambda: stream.connected)
+        assert server.received == [
+            {"action": "auth", "key": "key", "secret": "secret"},
+            {"action": "listen", "data": {"streams": ["trade_updates"]}},
+        ]
+
+    run_with_stream(scenario)
+
+def test_fill_resolves_await_order_fill():
+    alpaca = FakeAlpaca("new")
+
+    async def scenario(server, stream):
+        await wait_until(lambda: stream.connected and server.connections)
+        waiter = asyncio.create_task(index.await_order_fill("stock", "order-1", timeout=2))
+        await wait_until(lambda: "order-1" in stream._waiters)
+        await server.send_update("fill", {"id": "order-1", "status": "filled", "filled_qty": "3"})
+        order = await asyncio.wait_for(waiter, 1)
+        assert order["filled_qty"] == "3"
+        assert alpaca.polls == 0
+
+    run_with_stream(scenario, alpaca=alpaca)
+
+def test_fill_before_the_waiter_registers():
+    async def scenario(server, stream):
+        await wait_until(lambda: stream.connected and server.connections)
+        await server.send_update("fill", {"id": "order-2", "status": "filled"})
+        await wait_until(lambda: "order-2" in stream._recent)
+        order = await asyncio.wait_for(stream.wait_for_fill("order-2", timeout=1), 0.1)
+        assert order["status"] == "filled"
+
+    run_with_stream(scenario)
+
+def test_disconnect_falls_back_to_polling():
+    alpaca = FakeAlpaca("filled")
+
+    async def scenario(server, stream):
+        await wait_until(lambda: stream.connected and server.connections)
+        started = time.monotonic()
+        waiter = asyncio.create_task(index.await_order_fill("stock", "order-3", timeout=5))
+        await wait_until(lambda: "order-3" in stream._waiters)
+        await server.disconnect()
+        order = await asyncio.wait_for(waiter, 2)
+        assert order["status"] == "filled"
+        assert alpaca.polls >= 1
+        assert time.monotonic() - started < 2
+
+    run_with_stream(scenario, alpaca=alpaca)
+
+def test_not_connected_polls_directly():
+    alpaca = FakeAlpaca("filled")
+
+    async def scenario(server, stream):
+        # The server drops the connection right after listen
+        await wait_until(lambda: len(server.received) == 2)
+        await wait_until(lambda: not stream.connected)
+        order = await asyncio.wait_for(index.await_order_fill("stock", "order-5", timeout=5), 1)
+        assert order["status"] == "filled"
+        assert alpaca.polls == 1
+
+    run_with_stream(scenario, close_after_listen=True, alpaca=alpaca)
+
+def test_await_order_fill_has_one_total_deadline():
+    alpaca = FakeAlpaca("new")
+
+    async def scenario(server, stream):
+        await wait_until(lambda: stream.connected)
+        started = time.monotonic()
+        order = await index.await_order_fill("stock", "order-4", timeout=0.3)
+        assert order["status"] == "new"
+        assert time.monotonic() - started < 0.8
+        assert alpaca.polls >= 1
+
+    run_with_stream(scenario, alpaca=alpaca)